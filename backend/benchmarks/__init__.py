@@ -0,0 +1,8 @@
+"""
+Benchmarks for the chatbot backend.
+
+load.py drives the FastAPI app in-process (no network, stub LLM) at rising
+concurrency; micro.py times RAGService.search and the Markdown chunker on
+the real docs/ corpus. Run both with `python -m benchmarks` from backend/;
+see __main__.py for options.
+"""
@@ -0,0 +1,138 @@
+"""
+Run the benchmark suite and save the results as JSON.
+
+The app runs in-process with the offline stub LLM, no client-side quota
+(unless --rpm sets one) and a throwaway data directory, so results depend only on this code and
+machine. Compare against an earlier run with --compare; any latency or
+throughput metric that moved by more than --threshold is listed.
+
+Usage (from backend/):
+    python -m benchmarks
+    python -m benchmarks --concurrency 1 4 16 --requests 100 --compare data/benchmarks/baseline.json
+    python -m benchmarks --only micro --search-mode bm25
+    python -m benchmarks --endpoints translate_chapter --concurrency 1 4 --requests 8 --rpm 15
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import tempfile
+
+BACKEND_DIR = Path(__file__).parent.parent
+ENDPOINTS = ["chat", "chat_selected", "translate", "translate_chapter", "personalize", "ingest_batch"]
+
+# Progress from the benchmarks only; per-request service logs would swamp it
+logging.basicConfig(level=logging.WARNING, format="%(message)s")
+logger = logging.getLogger("benchmarks")
+logger.setLevel(logging.INFO)
+
+
+def configure_environment(args):
+    """Settings are read once, so this has to happen before the app is imported"""
+    os.environ.update({
+        "LLM_PROVIDER": "stub",
+        "STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "STUB_TOKENS_PER_SECOND": str(args.stub_tokens_per_second),
+        "LLM_REQUESTS_PER_MINUTE": str(args.rpm),
+        "LLM_TOKENS_PER_MINUTE": "0",
+        "DATA_DIR": args.data_dir or tempfile.mkdtemp(prefix="rag-bench-"),
+        "SEARCH_MODE": args.search_mode,
+    })
+    if args.no_cache:
+        for flag in ("ANSWER_CACHE_ENABLED", "TRANSLATION_CACHE_ENABLED", "PERSONALIZATION_CACHE_ENABLED"):
+            os.environ[flag] = "false"
+
+
+def run(args) -> dict:
+    configure_environment(args)
+    # Imported late, see configure_environment
+    import main
+    from benchmarks.corpus import load_corpus
+    from benchmarks.load import run_load
+    from benchmarks.micro import bench_chunking, bench_search
+    from config import get_settings
+    from services.rag_service import get_rag_service
+
+    settings = get_settings()
+    corpus = load_corpus()
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "search_mode": settings.search_mode,
+            "caches": not args.no_cache,
+            "stub_latency_ms": settings.stub_latency_ms,
+            "stub_tokens_per_second": settings.stub_tokens_per_second,
+            "llm_max_concurrency": settings.llm_max_concurrency,
+            "llm_requests_per_minute": settings.llm_requests_per_minute,
+            "llm_burst_seconds": settings.llm_burst_seconds,
+            "concurrency": args.concurrency,
+            "requests_per_level": args.requests,
+            "docs_files": len(corpus.files),
+        }
+    }
+
+    if args.only in (None, "load"):
+        results["load"] = asyncio.run(
+            run_load(
+                main.app, corpus, args.endpoints, args.concurrency, args.requests,
+                throwaway_data_dir=not args.data_dir
+            )
+        )
+
+    if args.only in (None, "micro"):
+        rag_service = get_rag_service()
+        if not rag_service.sources:
+            from services.ingestion import ingest_directory
+            ingest_directory(rag_service, BACKEND_DIR.parent / "docs", settings.ingest_workers)
+        results["micro"] = {
+            "chunking": bench_chunking(corpus, settings.chunk_max_tokens, settings.chunk_overlap_tokens),
+            "search": bench_search(rag_service, corpus)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot backend with a stub LLM")
+    parser.add_argument("--only", choices=["load", "micro"], help="Run just one part of the suite")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 32],
+                        help="Concurrent clients per load level")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per endpoint per level")
+    parser.add_argument("--search-mode", default="hybrid", choices=["bm25", "vector", "hybrid"],
+                        help="Retrieval mode for chat (hybrid also enables the vector/hybrid microbenchmarks)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable answer/translation/personalization caches")
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="Client-side requests-per-minute quota (0: none), to measure queueing")
+    parser.add_argument("--stub-latency-ms", type=float, default=50, help="Stub LLM time to first token")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=1000, help="Stub LLM output rate")
+    parser.add_argument("--data-dir", help="Data directory for the run (default: a fresh temp dir)")
+    parser.add_argument("--output", help="Result file (default: data/benchmarks/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change worth reporting")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    output = Path(args.output) if args.output else (
+        BACKEND_DIR / "data" / "benchmarks" / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    logger.info(f"Results written to {output}")
+
+    if args.compare:
+        from benchmarks.stats import compare
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        changes = compare(baseline, results, args.threshold)
+        logger.info("\n".join(changes) if changes else f"No metric moved more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
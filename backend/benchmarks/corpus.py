@@ -0,0 +1,49 @@
+"""
+Benchmark inputs taken from the real docs/ tree: the chapter files,
+questions made from their headings, and prose paragraphs to use as
+selections and as translate/personalize content.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from services.chunker import HEADING_PATTERN
+
+DOCS_PATH = Path(__file__).parent.parent.parent / "docs"
+
+
+@dataclass
+class Corpus:
+    files: dict[str, str]  # docs-relative path -> content
+    questions: list[str]
+    paragraphs: list[str]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(text.encode("utf-8")) for text in self.files.values())
+
+
+def load_corpus(docs_path: Path = DOCS_PATH, min_paragraph_words: int = 25) -> Corpus:
+    files = {
+        str(path.relative_to(docs_path)): path.read_text(encoding="utf-8")
+        for path in sorted(docs_path.rglob("*.md"))
+    }
+    questions, paragraphs = [], []
+    for text in files.values():
+        in_fence = False
+        for block in text.split("\n\n"):
+            block = block.strip()
+            fences = block.count("```")
+            if in_fence or fences:
+                # Skip code; a fence may span several blank-line separated blocks
+                if fences % 2:
+                    in_fence = not in_fence
+                continue
+            heading = HEADING_PATTERN.match(block)
+            if heading and "\n" not in block:
+                questions.append(f"What is {heading.group(2).strip()}?")
+            elif len(block.split()) >= min_paragraph_words and not block.startswith(("|", "<", "import ")):
+                paragraphs.append(block)
+    if not files:
+        raise FileNotFoundError(f"No Markdown files under {docs_path}")
+    return Corpus(files, questions, paragraphs)
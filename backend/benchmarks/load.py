@@ -0,0 +1,153 @@
+"""
+End-to-end load test: requests go through the real FastAPI app (routing,
+validation, services, caches) over an in-process ASGI transport, with the
+LLM provider set to the offline stub. Each endpoint runs at every
+concurrency level for a fixed number of requests; the result per level is
+its latency percentiles, throughput and error count.
+
+/api/ingest/batch is ingested once cold before anything else (chat needs
+the index); the load runs then measure the incremental path, where every
+file is hashed and found unchanged.
+
+Every level replays the same request sequence, and the answer, translation
+and personalization caches are emptied before each one, so each level
+measures the same workload from cold caches rather than the hits left by
+the level before it. Repeats within a level still hit, as they would in
+production. The translation cache's SQLite rows are only deleted in the
+benchmark's own throwaway data directory; with --data-dir just its memory
+layer is emptied.
+"""
+
+from typing import Callable
+import asyncio
+import itertools
+import logging
+import time
+
+import httpx
+
+from benchmarks.corpus import Corpus
+from benchmarks.stats import summarize
+from services.metrics import LLM_CALLS
+from services.personalization_service import get_personalization_service
+from services.rag_service import get_rag_service
+from services.translation_service import get_translation_service
+
+logger = logging.getLogger(__name__)
+
+PROFILES = [
+    {"experience_level": level, "background": background, "preferred_examples": examples}
+    for level, background, examples in itertools.product(
+        ["beginner", "intermediate", "advanced"], ["cs", "engineering", "physics", "other"], ["python", "cpp"]
+    )
+]
+
+
+def clear_caches(disk: bool = False):
+    """
+    Empty the in-memory response caches, so the next level starts cold.
+    Persisted translations are deleted too only with `disk`, which is
+    meant for a throwaway data directory.
+    """
+    for cache in (get_rag_service().answers, get_personalization_service().cache):
+        if cache is not None:
+            cache.clear()
+    translations = get_translation_service().cache
+    if translations is not None and disk:
+        translations.clear()
+    elif translations is not None:
+        translations.clear_memory()
+
+
+def endpoint_payloads(corpus: Corpus) -> dict[str, tuple[str, Callable[[int], dict]]]:
+    """Endpoint name -> (path, request number -> JSON body)"""
+    questions, paragraphs = corpus.questions, corpus.paragraphs
+    chapters = list(corpus.files.values())
+    return {
+        "chat": ("/api/chat", lambda i: {"message": questions[i % len(questions)]}),
+        "chat_selected": ("/api/chat/selected", lambda i: {
+            "message": "Can you explain this in simpler terms?",
+            "selected_text": paragraphs[i % len(paragraphs)]
+        }),
+        "translate": ("/api/translate", lambda i: {"content": paragraphs[i % len(paragraphs)]}),
+        "translate_chapter": ("/api/translate", lambda i: {"content": chapters[i % len(chapters)]}),
+        "personalize": ("/api/personalize", lambda i: {
+            "content": paragraphs[i % len(paragraphs)],
+            **PROFILES[i % len(PROFILES)]
+        }),
+        "ingest_batch": ("/api/ingest/batch", lambda i: None),
+    }
+
+
+async def _run_level(client: httpx.AsyncClient, path: str, payload: Callable[[int], dict],
+                     concurrency: int, requests: int) -> dict:
+    counter = itertools.count()
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            try:
+                body = payload(i)
+                response = await (client.post(path, json=body) if body is not None else client.post(path))
+                ok = response.status_code == 200
+            except Exception as e:
+                logger.warning(f"{path} failed: {e}")
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += not ok
+
+    calls_before = LLM_CALLS.value("stub", "ok")
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "errors": errors,
+        "llm_calls": int(LLM_CALLS.value("stub", "ok") - calls_before),
+        **summarize(latencies, elapsed)
+    }
+
+
+async def run_load(
+    app,
+    corpus: Corpus,
+    endpoints: list[str],
+    concurrency_levels: list[int],
+    requests_per_level: int,
+    throwaway_data_dir: bool = False
+) -> dict:
+    if not throwaway_data_dir:
+        logger.warning(
+            "Keeping the translation cache on disk in DATA_DIR: translate levels "
+            "after the first may be served from it rather than from cold"
+        )
+    transport = httpx.ASGITransport(app=app)
+    # Generous timeout: queued requests at high concurrency are part of the measurement
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        start = time.perf_counter()
+        response = await client.post("/api/ingest/batch")
+        response.raise_for_status()
+        results = {"cold_ingest": {
+            "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            "total_chunks": response.json()["total_chunks"]
+        }}
+
+        payloads = endpoint_payloads(corpus)
+        for name in endpoints:
+            path, payload = payloads[name]
+            levels = []
+            for concurrency in concurrency_levels:
+                clear_caches(disk=throwaway_data_dir)
+                level = await _run_level(
+                    client, path, payload, concurrency, max(requests_per_level, concurrency)
+                )
+                logger.info(
+                    f"{name} x{concurrency}: p50 {level['p50_ms']}ms, p95 {level['p95_ms']}ms, "
+                    f"p99 {level['p99_ms']}ms, {level['rps']} req/s, {level['errors']} errors, "
+                    f"{level['llm_calls']} model calls"
+                )
+                levels.append(level)
+            results[name] = levels
+    return results
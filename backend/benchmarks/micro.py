@@ -0,0 +1,56 @@
+"""
+Microbenchmarks over the docs/ corpus: the Markdown chunker (a full pass
+over every chapter) and RAGService.search per retrieval mode, unscoped and
+scoped to one chapter.
+"""
+
+import logging
+import time
+
+from benchmarks.corpus import Corpus
+from benchmarks.stats import summarize
+from services.chunker import chunk_markdown
+
+logger = logging.getLogger(__name__)
+
+
+def bench_chunking(corpus: Corpus, max_tokens: int, overlap_tokens: int, repeats: int = 5) -> dict:
+    passes, chunks = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = sum(
+            1 for text in corpus.files.values()
+            for _ in chunk_markdown(text, max_tokens, overlap_tokens)
+        )
+        passes.append((time.perf_counter() - start) * 1000)
+    summary = summarize(passes)
+    summary.update({
+        "files": len(corpus.files),
+        "chunks": chunks,
+        "mb_per_s": round(corpus.total_bytes / 1e6 / (summary["p50_ms"] / 1000), 3)
+    })
+    return summary
+
+
+def bench_search(rag_service, corpus: Corpus, limit: int = 3, repeats: int = 3) -> dict:
+    """
+    Per-query latency for each mode the service has indexes for ("vector"
+    and "hybrid" need SEARCH_MODE other than bm25).
+    """
+    modes = ["bm25"] + (["vector", "hybrid"] if rag_service.hybrid is not None else [])
+    chapter = sorted(rag_service.metadata.values("chapter"))[0]
+    results = {}
+    for mode in modes:
+        for scope, kwargs in (("all", {}), ("chapter", {"chapter": chapter})):
+            rag_service.search(corpus.questions[0], limit, mode=mode, **kwargs)  # warm up
+            latencies = []
+            for _ in range(repeats):
+                for question in corpus.questions:
+                    start = time.perf_counter()
+                    rag_service.search(question, limit, mode=mode, **kwargs)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            summary = summarize(latencies)
+            summary["queries_per_s"] = round(1000 / summary["mean_ms"], 1)
+            results[f"{mode}_{scope}"] = summary
+            logger.info(f"search {mode} ({scope}): p50 {summary['p50_ms']}ms, p99 {summary['p99_ms']}ms")
+    return results
@@ -0,0 +1,66 @@
+"""
+Latency summaries and baseline comparison for benchmark results.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+
+def summarize(latencies_ms: list[float], elapsed_s: Optional[float] = None) -> dict:
+    """Percentiles (ms) of a sample; with `elapsed_s`, also throughput"""
+    if not latencies_ms:
+        return {"count": 0}
+    sample = np.asarray(latencies_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(sample, [50, 95, 99])
+    summary = {
+        "count": len(latencies_ms),
+        "mean_ms": round(float(sample.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(sample.max()), 3)
+    }
+    if elapsed_s:
+        summary["rps"] = round(len(latencies_ms) / elapsed_s, 2)
+    return summary
+
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """{"load.chat.c8.p95_ms": 12.3, ...} for every numeric leaf"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "concurrency" in item:
+                    flat.update(_flatten(item, f"{path}.c{item['concurrency']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> list[str]:
+    """
+    Lines describing latency and throughput metrics that moved by more than
+    `threshold` (a fraction) against `baseline`. Higher is worse for
+    latency percentiles, lower is worse for rps and *_per_s.
+    """
+    old, new = _flatten(baseline), _flatten(current)
+    lines = []
+    for path in sorted(old.keys() & new.keys()):
+        # Max and mean ride on single outliers; percentiles are steadier
+        lower_is_better = path.endswith(("p50_ms", "p95_ms", "p99_ms", "latency_ms"))
+        if not (lower_is_better or path.endswith("rps") or path.endswith("_per_s")):
+            continue
+        before, after = old[path], new[path]
+        if not before:
+            continue
+        change = (after - before) / before
+        if abs(change) < threshold:
+            continue
+        worse = change > 0 if lower_is_better else change < 0
+        lines.append(f"{'REGRESSION' if worse else 'improved  '} {path}: {before} -> {after} ({change:+.0%})")
+    return lines
@@ -6,25 +6,154 @@ Supports both Google Gemini (free) and OpenAI APIs.
 
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).parent
 
 
 class Settings(BaseSettings):
     # Google Gemini - FREE tier available (recommended)
     gemini_api_key: str = ""
     
+    # Model behind chat, translation and personalization: "gemini",
+    # "openai" (uses openai_chat_model) or "stub" (offline, deterministic;
+    # for tests and benchmarks)
+    llm_provider: str = "gemini"
+    
+    # Shared model settings; llm_model is the Gemini model name
+    llm_model: str = "gemini-2.0-flash-exp"
+    llm_temperature: Optional[float] = None  # None = model default
+    llm_max_output_tokens: Optional[int] = None
+    llm_timeout_seconds: float = 60
+    
+    # Max Gemini calls in flight at once; further calls wait in a queue
+    llm_max_concurrency: int = 8
+    
+    # Client-side quota (0 disables a limit). Defaults match the Gemini free
+    # tier; calls queue by priority (chat first) until quota is available,
+    # and 429s are retried with exponential backoff. The burst lets two
+    # chapter translations (1-2 calls each) start at once, and the queue
+    # timeout covers a few concurrent chapters at 4s per call
+    llm_requests_per_minute: float = 15
+    llm_tokens_per_minute: float = 1_000_000
+    llm_burst_seconds: float = 20
+    llm_max_retries: int = 3
+    llm_queue_timeout_seconds: float = 60
+    
+    # Stub provider: time to first token, then words per second
+    stub_latency_ms: float = 200
+    stub_tokens_per_second: float = 50
+    stub_response_tokens: int = 120
+    
     # OpenAI - for embeddings and chat (optional, paid)
     openai_api_key: str = ""
     openai_embedding_model: str = "text-embedding-3-small"
     openai_chat_model: str = "gpt-4o-mini"
     
-    # Qdrant Cloud - for vector storage
+    # Retrieval: "bm25" (keyword index), "vector" (dense embeddings) or
+    # "hybrid" (both, fused with reciprocal-rank fusion, then reranked)
+    search_mode: str = "bm25"
+    embedding_backend: str = "hashing"  # hashing (offline) or openai
+    embedding_dimension: int = 256  # hashing embedder only
+    hybrid_candidates: int = 20
+    hybrid_lexical_budget_ms: float = 50
+    hybrid_vector_budget_ms: float = 50
+    rerank_enabled: bool = True
+    rerank_budget_ms: float = 20
+    rerank_min_score_ratio: float = 0.5  # drop chunks scoring below this share of the best
+    
+    # Where embeddings live: "memory" (local matrix) or "qdrant"
+    vector_store: str = "memory"
+    
+    # Qdrant Cloud - for vector storage. QDRANT_URL may also be a local
+    # path or ":memory:" to run Qdrant in-process without a server
     qdrant_url: str = ""
     qdrant_api_key: str = ""
     qdrant_collection_name: str = "physical_ai_textbook"
+    qdrant_upsert_batch_size: int = 128
+    qdrant_timeout_seconds: int = 10
+    
+    # Chunking for ingestion (token counts via tiktoken)
+    chunk_max_tokens: int = 400
+    chunk_overlap_tokens: int = 50
+    ingest_workers: int = 4
+    
+    # Answer cache for chat: exact (normalized) and near-duplicate questions
+    # reuse an answer when they retrieve mostly the same chunks
+    answer_cache_enabled: bool = True
+    answer_cache_items: int = 1024
+    answer_cache_similarity: float = 0.9  # word-set Jaccard between normalized questions
+    answer_cache_min_overlap: float = 0.3  # share of the cached answer's chunks retrieved again
+    
+    # Chat prompt budget (tokens). Selection, history and retrieved chunks are
+    # packed into it, de-duplicated and cut on sentence boundaries; a chunk
+    # is not cut down below prompt_min_piece_tokens
+    prompt_max_tokens: int = 3000
+    prompt_min_piece_tokens: int = 50
     
-    # Neon Postgres - for user data
+    # Context for /api/chat/selected: "selection" (the highlighted text only)
+    # or "neighborhood" (the chunks it came from plus selection_neighbors
+    # chunks either side, found through the selection index)
+    selection_context: str = "selection"
+    selection_neighbors: int = 1
+    
+    # Persist the index under data/index and memory-map it on startup
+    index_persist: bool = True
+    # A single-document ingest snapshots the index this long afterwards,
+    # once for all ingests in between (0 = right away)
+    index_save_delay_seconds: float = 5
+    
+    # Local state (caches, indexes); relative paths live under backend/
+    data_dir: str = "data"
+    
+    # Translation cache: in-memory LRU in front of a SQLite file
+    translation_cache_enabled: bool = True
+    translation_cache_memory_items: int = 2048
+    
+    # Chapters are translated in units of at most this many prose tokens
+    # (code and math between them is swapped for markers, not sent), with
+    # up to translation_max_parallel units in flight per request
+    translation_segment_max_tokens: int = 800
+    translation_max_parallel: int = 4
+    # Concurrent requests translating the same segment share one model call
+    translation_coalesce_requests: bool = True
+    
+    # Personalization cache, keyed by content hash + canonical user profile
+    personalization_cache_enabled: bool = True
+    personalization_cache_items: int = 1024
+    personalization_cache_ttl_seconds: float = 86400
+    personalization_coalesce_requests: bool = True  # identical in-flight requests share one call
+    
+    # Neon Postgres - for user data. Chat history is also written here when
+    # set (postgresql://... or sqlite:///path); otherwise it is memory-only
     database_url: str = ""
     
+    # Chat history per conversation_id: recent turns up to a token budget,
+    # older turns folded into a capped running summary
+    conversation_memory_enabled: bool = True
+    conversation_max_items: int = 1000
+    conversation_ttl_seconds: float = 3600
+    conversation_window_tokens: int = 1000
+    conversation_summary_tokens: int = 300
+    
+    # Request tracing: share of requests traced (with trace_trust_traceparent,
+    # a W3C traceparent header's sampled flag decides instead), where
+    # finished traces go ("" none, "console", or "file" = OTLP/JSON lines in
+    # data/<trace_file>), and how many of the slowest recent traces
+    # /debug/slow-requests keeps
+    trace_sample_rate: float = 0.05
+    # Only behind a proxy that sets traceparent itself: clients could
+    # otherwise get every request traced and fill the slow-request log
+    trace_trust_traceparent: bool = False
+    trace_exporter: str = ""
+    trace_file: str = "traces.jsonl"
+    trace_slow_requests: int = 20
+    trace_slow_window_seconds: float = 900
+    # /debug/slow-requests shows request paths, timings and span attributes,
+    # so it is only served when explicitly switched on
+    trace_debug_endpoint: bool = False
+    
     # App settings - allow all origins for deployment
     cors_origins: list[str] = [
         "http://localhost:3000",
@@ -42,3 +171,12 @@ class Settings(BaseSettings):
 @lru_cache()
 def get_settings() -> Settings:
     return Settings()
+
+
+def data_path(*parts: str) -> Path:
+    """Path inside the configured data directory, creating the directory if needed"""
+    base = Path(get_settings().data_dir)
+    if not base.is_absolute():
+        base = BACKEND_DIR / base
+    base.mkdir(parents=True, exist_ok=True)
+    return base.joinpath(*parts)
@@ -5,15 +5,25 @@ This powers the AI assistant embedded in my Physical AI textbook.
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-import os
+import asyncio
+import json
+import logging
 from pathlib import Path
 
 from config import get_settings
 from services.rag_service import get_rag_service
+from services.ingestion import ingest_directory
 from services.translation_service import get_translation_service
-from services.personalization_service import get_personalization_service, UserProfile
+from services.personalization_service import DEFAULT_INTERESTS, get_personalization_service, UserProfile
+from services.variant_store import get_variant_store
+from services.conversation_store import get_conversation_store
+from services import metrics
+from services.tracing import TracingMiddleware, get_tracer
+
+logger = logging.getLogger(__name__)
 
 # Create the FastAPI app
 app = FastAPI(
@@ -31,6 +41,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.on_event("startup")
+def open_conversation_store():
+    """Open DATABASE_URL now, so a bad URL or missing driver stops the server at boot"""
+    if settings.conversation_memory_enabled:
+        get_conversation_store()
 
 
 # Request/Response models
@@ -38,6 +57,8 @@ class ChatRequest(BaseModel):
     message: str
     selected_text: Optional[str] = None
     conversation_id: Optional[str] = None
+    chapter: Optional[str] = None  # restrict retrieval, e.g. "chapter-02-foundations"
+    source: Optional[str] = None  # or to one page, e.g. "chapter-02-foundations/ros2-intro.md"
 
 
 class ChatResponse(BaseModel):
@@ -59,6 +80,7 @@ class IngestResponse(BaseModel):
 class TranslateRequest(BaseModel):
     content: str
     target_language: str = "urdu"
+    source: Optional[str] = None  # docs path, e.g. "chapter-02-foundations/ros2-intro.md"
 
 
 class TranslateResponse(BaseModel):
@@ -73,6 +95,7 @@ class PersonalizeRequest(BaseModel):
     background: str = "other"  # cs, engineering, physics, other
     interests: list[str] = []
     preferred_examples: str = "python"  # python, cpp, both
+    source: Optional[str] = None  # docs path, e.g. "chapter-02-foundations/ros2-intro.md"
 
 
 class PersonalizeResponse(BaseModel):
@@ -86,6 +109,34 @@ async def health_check():
     return {"status": "healthy", "service": "rag-chatbot"}
 
 
+# Prometheus scrape endpoint: stage timings, cache hits, 429s, tokens, in-flight work
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Span breakdown of the slowest recently traced requests (only with TRACE_DEBUG_ENDPOINT on)
+@app.get("/debug/slow-requests")
+async def slow_requests(limit: int = 20):
+    if not settings.trace_debug_endpoint:
+        raise HTTPException(status_code=404, detail="Not Found")
+    tracer = get_tracer()
+    return {
+        "sample_rate": tracer.sample_rate,
+        "sampled": tracer.sampled,
+        "requests": [
+            {
+                "trace_id": trace.trace_id,
+                "name": trace.root.name,
+                "duration_ms": round(trace.root.duration_ms, 3),
+                "started_at": trace.root.start_ns / 1e9,
+                "spans": trace.tree()
+            }
+            for trace in tracer.slow_log.slowest()[:limit]
+        ]
+    }
+
+
 # Main chat endpoint
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -97,9 +148,12 @@ async def chat(request: ChatRequest):
         rag_service = get_rag_service()
         
         # Generate response (now returns tuple)
-        response_text, sources = rag_service.generate_response(
+        response_text, sources = await rag_service.generate_response_async(
             query=request.message,
-            selected_text=request.selected_text
+            selected_text=request.selected_text,
+            chapter=request.chapter,
+            source=request.source,
+            conversation_id=request.conversation_id
         )
         
         return ChatResponse(
@@ -111,6 +165,43 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Streaming chat - same as /api/chat but sends tokens as Server-Sent Events
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream the answer as it is generated. The first event carries the
+    sources, then each "token" event carries the next piece of text.
+    """
+    rag_service = get_rag_service()
+    
+    def frame(event: str, payload: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    async def event_stream():
+        # The 200 and headers are already sent, so a failure mid-stream can
+        # only be reported as an event
+        try:
+            async for event, payload in rag_service.stream_response(
+                query=request.message,
+                selected_text=request.selected_text,
+                chapter=request.chapter,
+                source=request.source,
+                conversation_id=request.conversation_id
+            ):
+                if event == "sources":
+                    payload = {"sources": payload["sources"][:3]}
+                yield frame(event, payload)
+        except Exception as e:
+            logger.exception(f"Chat stream failed: {e}")
+            yield frame("error", {"message": "Sorry, something went wrong while answering. Please try again."})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # Selected text chat - for when users highlight text and ask about it
 @app.post("/api/chat/selected", response_model=ChatResponse)
 async def chat_about_selection(request: ChatRequest):
@@ -123,16 +214,19 @@ async def chat_about_selection(request: ChatRequest):
     try:
         rag_service = get_rag_service()
         
-        # Use selected text as primary context (returns tuple now)
-        response_text, _ = rag_service.generate_response(
+        # Use selected text (or the chunks around it) as primary context;
+        # no search runs since the context is already known
+        context, sources = await asyncio.to_thread(rag_service.selection_context, request.selected_text)
+        response_text, _ = await rag_service.generate_response_async(
             query=request.message,
-            context=request.selected_text,
-            selected_text=request.selected_text
+            context=context,
+            selected_text=request.selected_text,
+            conversation_id=request.conversation_id
         )
         
         return ChatResponse(
             response=response_text,
-            sources=[{"text": request.selected_text[:200], "source": "selected", "score": 1.0}]
+            sources=sources[:3]
         )
         
     except Exception as e:
@@ -147,9 +241,17 @@ async def translate_content(request: TranslateRequest):
     This enables the Urdu translation bonus feature.
     """
     try:
-        translation_service = get_translation_service()
+        # Precomputed by pregenerate.py? Then no model call at all
+        variant_store = get_variant_store()
+        translated = None
+        if variant_store:
+            translated = await asyncio.to_thread(
+                variant_store.get, "translate", request.target_language, request.content, request.source
+            )
         
-        translated = translation_service.translate_to_urdu(request.content)
+        if translated is None:
+            translation_service = get_translation_service()
+            translated = await translation_service.translate_to_urdu_async(request.content)
         
         return TranslateResponse(
             translated_content=translated,
@@ -174,14 +276,23 @@ async def personalize_content(request: PersonalizeRequest):
         user_profile = UserProfile(
             experience_level=request.experience_level,
             background=request.background,
-            interests=request.interests or ["robotics"],
+            interests=request.interests or list(DEFAULT_INTERESTS),
             preferred_examples=request.preferred_examples
         )
         
-        personalized = personalization_service.personalize_content(
-            request.content, 
-            user_profile
-        )
+        # Precomputed by pregenerate.py? Then no model call at all
+        variant_store = get_variant_store()
+        personalized = None
+        if variant_store:
+            personalized = await asyncio.to_thread(
+                variant_store.get, "personalize", user_profile.canonical().bucket(), request.content, request.source
+            )
+        
+        if personalized is None:
+            personalized = await personalization_service.personalize_content_async(
+                request.content, 
+                user_profile
+            )
         
         return PersonalizeResponse(
             personalized_content=personalized,
@@ -207,7 +318,8 @@ async def ingest_document(request: IngestRequest):
             "chapter": request.chapter or "unknown"
         }
         
-        chunks_count = rag_service.ingest_document(request.content, metadata)
+        # Chunking and embedding run in a thread, off the event loop
+        chunks_count = await asyncio.to_thread(rag_service.ingest_document, request.content, metadata)
         
         return IngestResponse(
             chunks_ingested=chunks_count,
@@ -223,7 +335,8 @@ async def ingest_document(request: IngestRequest):
 async def batch_ingest():
     """
     Ingest all markdown files from the docs folder.
-    Run this once to populate the vector store.
+    Unchanged files are skipped by content hash, so re-running this after
+    editing one chapter only re-chunks that chapter.
     """
     try:
         rag_service = get_rag_service()
@@ -232,32 +345,22 @@ async def batch_ingest():
         if not docs_path.exists():
             raise HTTPException(status_code=404, detail="Docs folder not found")
         
-        total_chunks = 0
-        files_processed = 0
-        
-        for md_file in docs_path.rglob("*.md"):
-            content = md_file.read_text(encoding="utf-8")
-            relative_path = md_file.relative_to(docs_path)
-            
-            # Extract chapter from path
-            parts = str(relative_path).split(os.sep)
-            chapter = parts[0] if len(parts) > 1 else "intro"
-            
-            metadata = {
-                "source": str(relative_path),
-                "chapter": chapter
-            }
-            
-            chunks = rag_service.ingest_document(content, metadata)
-            total_chunks += chunks
-            files_processed += 1
+        # Runs on a worker pool, off the event loop
+        report = await asyncio.to_thread(
+            ingest_directory, rag_service, docs_path, settings.ingest_workers
+        )
         
         return {
             "message": f"Batch ingestion complete",
-            "files_processed": files_processed,
-            "total_chunks": total_chunks
+            "files_processed": report.files_processed,
+            "files_skipped": report.files_skipped,
+            "files_removed": report.files_removed,
+            "total_chunks": report.total_chunks,
+            "elapsed_ms": report.elapsed_ms
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,154 @@
+"""
+Offline pre-generation of translated and personalized chapter variants.
+
+Walks docs/, runs every chapter through the translation and personalization
+services for each language and profile bucket, and writes the results to
+data/variants.sqlite3. The API serves these variants directly and only calls
+Gemini when a request has no precomputed match.
+
+Runs are resumable: variants already generated from the current file
+contents are skipped, so an interrupted or rate-limited run can simply be
+started again.
+
+`--rpm` caps model calls, not jobs: a chapter translation fans out into one
+call per translation unit, so the budget is enforced by the LLM client's
+shared rate limiter, which every one of those calls goes through.
+
+Usage:
+    python pregenerate.py --concurrency 2 --rpm 10
+"""
+
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import random
+
+from config import data_path, get_settings
+from services.llm_client import get_llm_client
+from services.personalization_service import (
+    BACKGROUNDS, DEFAULT_INTERESTS, EXAMPLE_LANGUAGES, EXPERIENCE_LEVELS, UserProfile,
+    get_personalization_service
+)
+from services.rate_limiter import RateLimiter
+from services.translation_service import get_translation_service
+from services.variant_store import VariantStore, content_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("pregenerate")
+
+DOCS_PATH = Path(__file__).parent.parent / "docs"
+
+LANGUAGES = ["urdu"]
+
+
+@dataclass
+class Job:
+    kind: str  # "translate" or "personalize"
+    source: str
+    variant: str
+    content: str
+    digest: str
+    profile: UserProfile = None
+
+
+def profile_buckets() -> list[UserProfile]:
+    """
+    Every level/background/examples combination with the interests the
+    frontend sends by default (['robotics', 'ai'], also used when a reader
+    picked none). Other interest sets are personalized on demand.
+    """
+    return [
+        UserProfile(level, background, list(DEFAULT_INTERESTS), examples).canonical()
+        for level, background, examples in product(EXPERIENCE_LEVELS, BACKGROUNDS, EXAMPLE_LANGUAGES)
+    ]
+
+
+def plan_jobs(store: VariantStore, docs_path: Path, kinds: list[str]) -> tuple[list[Job], int]:
+    """All (chapter x variant) jobs that are missing or stale in the store"""
+    jobs = []
+    skipped = 0
+    profiles = profile_buckets()
+
+    for md_file in sorted(docs_path.rglob("*.md")):
+        source = md_file.relative_to(docs_path).as_posix()
+        content = md_file.read_text(encoding="utf-8")
+        digest = content_hash(content)
+
+        candidates = []
+        if "translate" in kinds:
+            candidates += [Job("translate", source, language, content, digest) for language in LANGUAGES]
+        if "personalize" in kinds:
+            candidates += [
+                Job("personalize", source, profile.bucket(), content, digest, profile)
+                for profile in profiles
+            ]
+
+        for job in candidates:
+            if store.is_current(job.kind, job.source, job.variant, job.digest):
+                skipped += 1
+            else:
+                jobs.append(job)
+
+    return jobs, skipped
+
+
+async def run_job(job: Job) -> str:
+    if job.kind == "translate":
+        return await get_translation_service().translate_to_urdu_async(job.content)
+    return await get_personalization_service().personalize_content_async(job.content, job.profile)
+
+
+async def run(args):
+    store = VariantStore(data_path("variants.sqlite3"))
+    jobs, skipped = plan_jobs(store, Path(args.docs), args.kinds)
+    if args.limit:
+        jobs = jobs[:args.limit]
+    logger.info(f"{len(jobs)} variants to generate, {skipped} already up to date")
+
+    if args.rpm:
+        settings = get_settings()
+        get_llm_client().limiter = RateLimiter(
+            args.rpm, settings.llm_tokens_per_minute, burst_seconds=settings.llm_burst_seconds
+        )
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    done = failed = 0
+
+    async def worker(job: Job):
+        nonlocal done, failed
+        async with semaphore:
+            for attempt in range(args.retries + 1):
+                try:
+                    output = await run_job(job)
+                    store.put(job.kind, job.source, job.variant, job.digest, output)
+                    done += 1
+                    logger.info(f"[{done}/{len(jobs)}] {job.kind} {job.source} ({job.variant})")
+                    return
+                except Exception as e:
+                    logger.warning(f"{job.kind} {job.source} ({job.variant}) failed: {e}")
+                    if attempt < args.retries:
+                        # Back off with jitter; quota errors usually clear within a minute
+                        await asyncio.sleep(min(60.0, 2 ** attempt) * (1 + random.random()))
+            failed += 1
+
+    await asyncio.gather(*(worker(job) for job in jobs))
+    logger.info(f"Done: {done} generated, {failed} failed, {skipped} skipped. Re-run to resume failures.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate translated and personalized chapter variants")
+    parser.add_argument("--docs", default=str(DOCS_PATH), help="Docs folder to walk")
+    parser.add_argument("--kinds", nargs="+", default=["translate", "personalize"],
+                        choices=["translate", "personalize"])
+    parser.add_argument("--concurrency", type=int, default=2, help="Variants generated at once")
+    parser.add_argument("--rpm", type=float, default=10,
+                        help="Max model calls per minute (0 = the configured LLM_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per variant before giving up")
+    parser.add_argument("--limit", type=int, default=0, help="Only generate this many variants (0 = all)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Answer Cache - reuses chat answers for repeated and near-duplicate questions.
+Questions are normalized ("What's ROS 2?" and "what is ros2" become the
+same key); near-duplicates are found with MinHash + LSH over their words
+and confirmed with an exact word-set Jaccard check. Whole words, and a
+strict threshold, because one changed word ("supervised" vs
+"unsupervised") is a different question. An answer is only reused when
+the new question retrieves mostly the same chunks it was grounded on, and
+it is dropped as soon as an ingest removes one of them.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+import logging
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from services.search_index import TOKEN_PATTERN
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 4 rows per band
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+POSSESSIVE = re.compile(r"['’]s\b")
+SPLIT_NUMBER = re.compile(r"\b([a-z]+) (\d+)\b")
+# Only words that never change what is asked; unlike the search stopwords,
+# question words and negations ("why", "not") are kept
+FILLER_WORDS = frozenset("a an the is are was were be do does did of please".split())
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop filler words and punctuation, and glue "ros 2" into "ros2" """
+    text = POSSESSIVE.sub("", query.lower())
+    words = [word for word in TOKEN_PATTERN.findall(text) if word not in FILLER_WORDS]
+    return SPLIT_NUMBER.sub(r"\1\2", " ".join(words))
+
+
+def _words(normalized: str) -> frozenset[str]:
+    return frozenset(normalized.split())
+
+
+def _signature(words: frozenset[str]) -> np.ndarray:
+    """MinHash signature; each permutation is h -> (a*h + b) mod p"""
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in words), dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME
+    return permuted.min(axis=0)
+
+
+def _bands(signature: np.ndarray) -> list[tuple[int, bytes]]:
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+@dataclass
+class CachedAnswer:
+    key: str  # normalized question
+    answer: str
+    chunk_ids: frozenset[int]
+    words: frozenset[str]
+    bands: list[tuple[int, bytes]]
+
+
+class AnswerCache:
+    def __init__(self, max_items: int = 1024, similarity: float = 0.9, min_overlap: float = 0.3):
+        """
+        `similarity` is the word-set Jaccard a near-duplicate question needs;
+        `min_overlap` is the share of the cached answer's chunks that the new
+        question has to retrieve again.
+        """
+        self.max_items = max_items
+        self.similarity = similarity
+        self.min_overlap = min_overlap
+        self._items: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._buckets: dict[tuple[int, bytes], set[str]] = {}
+        self._by_chunk: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _grounded(self, entry: CachedAnswer, chunk_ids: frozenset[int]) -> bool:
+        return len(entry.chunk_ids & chunk_ids) / len(entry.chunk_ids) >= self.min_overlap
+
+    def get(self, query: str, chunk_ids: Iterable[int]) -> Optional[CachedAnswer]:
+        """Cached answer for `query` given the chunks it retrieves now, or None"""
+        key = normalize_query(query)
+        if not key:
+            return None
+        chunk_ids = frozenset(chunk_ids)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and self._grounded(entry, chunk_ids):
+                self._items.move_to_end(key)
+                self.exact_hits += 1
+                return entry
+
+            words = _words(key)
+            candidates = set()
+            for band in _bands(_signature(words)):
+                candidates |= self._buckets.get(band, set())
+            best, best_score = None, self.similarity
+            for candidate_key in candidates:
+                candidate = self._items[candidate_key]
+                score = _jaccard(words, candidate.words)
+                if score >= best_score and self._grounded(candidate, chunk_ids):
+                    best, best_score = candidate, score
+            if best is not None:
+                self._items.move_to_end(best.key)
+                self.near_hits += 1
+                return best
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, chunk_ids: Iterable[int], answer: str):
+        key = normalize_query(query)
+        if not key:
+            return
+        words = _words(key)
+        entry = CachedAnswer(key, answer, frozenset(chunk_ids), words, _bands(_signature(words)))
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = entry
+            for band in entry.bands:
+                self._buckets.setdefault(band, set()).add(key)
+            for chunk_id in entry.chunk_ids:
+                self._by_chunk.setdefault(chunk_id, set()).add(key)
+            while len(self._items) > self.max_items:
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def _drop(self, key: str):
+        """Remove an entry and its LSH / chunk references; caller holds the lock"""
+        entry = self._items.pop(key)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+        for chunk_id in entry.chunk_ids:
+            keys = self._by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[chunk_id]
+
+    def invalidate(self, chunk_ids: Iterable[int]) -> int:
+        """Drop every answer grounded on any of `chunk_ids`"""
+        with self._lock:
+            keys = set()
+            for chunk_id in chunk_ids:
+                keys |= self._by_chunk.get(chunk_id, set())
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+        if keys:
+            logger.info(f"Answer cache: invalidated {len(keys)} answers")
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._buckets.clear()
+            self._by_chunk.clear()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.near_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "items": len(self._items)
+        }
@@ -0,0 +1,360 @@
+"""
+Chunk Store - persistent, memory-mapped snapshot of the RAG index.
+Everything is written as flat binary files and opened with mmap, so a cold
+start maps the index in milliseconds instead of re-ingesting the docs, and
+several uvicorn workers on one machine share the same page-cache pages.
+
+The index directory holds one subdirectory per saved generation and a
+CURRENT file naming the live one. A save writes a new generation and then
+replaces CURRENT (an atomic rename), so a crash at any point leaves either
+the old or the new snapshot in place, never neither.
+
+Layout of a snapshot (generation) directory:
+    manifest.json   counts, BM25 stats, embedder info, ingest manifest
+    ids.i64         chunk ids, ascending (row i holds chunk ids[i])
+    text.bin/.off   UTF-8 chunk text arena + int64 offsets (n + 1)
+    meta.bin/.off   per-chunk JSON metadata arena + int64 offsets
+    terms.bin/.off  sorted vocabulary arena + int64 offsets (V + 1)
+    post.off        int64 offsets into the postings per term (V + 1)
+    post.row/.tf    int32 postings: chunk row and term frequency
+    doclen.i32      BM25 document length per row
+    vectors.f32     (n, dimension) float32 embeddings, normalized rows
+    facets.i64      chunk ids per chapter / source (see metadata_index.py)
+"""
+
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from services.metadata_index import MetadataIndex
+from services.search_index import BM25Index, tokenize
+from services.vector_index import VectorIndex, top_k
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+POINTER = "CURRENT"
+
+
+def _write_arena(path: Path, items: list[bytes]):
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(path.with_suffix(".bin"), "wb") as f:
+        for i, item in enumerate(items):
+            f.write(item)
+            offsets[i + 1] = offsets[i] + len(item)
+    offsets.tofile(path.with_suffix(".off"))
+
+
+def _map(path: Path, dtype, shape=None) -> np.ndarray:
+    """Read-only memory map; empty files map to an empty array"""
+    if path.stat().st_size == 0:
+        return np.zeros(shape if shape else 0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def save_snapshot(
+    directory: Path,
+    chunks: dict,
+    index: BM25Index,
+    vectors: Optional[VectorIndex],
+    manifest: dict,
+    metadata: Optional[MetadataIndex] = None
+):
+    """
+    Write a snapshot of the in-memory store as a new generation under
+    `directory`, then point CURRENT at it. Readers never see a half-written
+    snapshot, and older generations are removed once the switch is made.
+    """
+    start = time.perf_counter()
+    ids = sorted(chunks)
+    rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+    generation = f"gen-{time.time_ns()}-{os.getpid()}"
+    tmp = directory / generation
+    tmp.mkdir(parents=True)
+
+    np.asarray(ids, dtype=np.int64).tofile(tmp / "ids.i64")
+    _write_arena(tmp / "text", [chunks[i]["text"].encode("utf-8") for i in ids])
+    _write_arena(tmp / "meta", [
+        json.dumps({k: v for k, v in chunks[i].items() if k != "text"}).encode("utf-8")
+        for i in ids
+    ])
+
+    terms = sorted(index.postings)
+    _write_arena(tmp / "terms", [term.encode("utf-8") for term in terms])
+    post_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    post_rows, post_tfs = [], []
+    for t, term in enumerate(terms):
+        postings = sorted((rows[doc_id], tf) for doc_id, tf in index.postings[term].items())
+        post_rows.extend(row for row, _ in postings)
+        post_tfs.extend(tf for _, tf in postings)
+        post_offsets[t + 1] = post_offsets[t] + len(postings)
+    post_offsets.tofile(tmp / "post.off")
+    np.asarray(post_rows, dtype=np.int32).tofile(tmp / "post.row")
+    np.asarray(post_tfs, dtype=np.int32).tofile(tmp / "post.tf")
+    np.asarray([index.doc_lengths[i] for i in ids], dtype=np.int32).tofile(tmp / "doclen.i32")
+
+    dimension = None
+    if vectors is not None:
+        dimension = vectors.dimension
+        matrix = np.zeros((len(ids), dimension), dtype=np.float32)
+        for row, chunk_id in enumerate(ids):
+            matrix[row] = vectors.vector(chunk_id)
+        matrix.tofile(tmp / "vectors.f32")
+
+    if metadata is None:
+        metadata = MetadataIndex()
+        for chunk_id in ids:
+            metadata.add(chunk_id, chunks[chunk_id])
+    facets = metadata.save(tmp)
+
+    with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({
+            **manifest,
+            "facets": facets,
+            "version": FORMAT_VERSION,
+            "count": len(ids),
+            "total_length": index.total_length,
+            "k1": index.k1,
+            "b": index.b,
+            "dimension": dimension
+        }, f)
+
+    pointer = directory / f"{POINTER}.tmp-{os.getpid()}"
+    pointer.write_text(generation, encoding="utf-8")
+    os.replace(pointer, directory / POINTER)
+
+    # Earlier generations; processes that still map them keep their pages
+    # until they remap
+    for entry in directory.glob("gen-*"):
+        if entry.name != generation:
+            shutil.rmtree(entry, ignore_errors=True)
+    logger.info(f"Saved index snapshot of {len(ids)} chunks in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+class MappedChunks:
+    """Read-only mapping of chunk id -> chunk dict, decoded lazily from the arenas"""
+
+    def __init__(self, directory: Path):
+        self.ids = _map(directory / "ids.i64", np.int64)
+        self._text = _map(directory / "text.bin", np.uint8)
+        self._text_off = _map(directory / "text.off", np.int64)
+        self._meta = _map(directory / "meta.bin", np.uint8)
+        self._meta_off = _map(directory / "meta.off", np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return (int(i) for i in self.ids)
+
+    def __contains__(self, chunk_id) -> bool:
+        return self.row(chunk_id) is not None
+
+    def row(self, chunk_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row < len(self.ids) and self.ids[row] == chunk_id:
+            return row
+        return None
+
+    def text_at(self, row: int) -> str:
+        return bytes(self._text[self._text_off[row]:self._text_off[row + 1]]).decode("utf-8")
+
+    def at(self, row: int) -> dict:
+        meta = json.loads(bytes(self._meta[self._meta_off[row]:self._meta_off[row + 1]]))
+        return {"text": self.text_at(row), **meta}
+
+    def __getitem__(self, chunk_id: int) -> dict:
+        row = self.row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self.at(row)
+
+    def get(self, chunk_id: int, default=None):
+        row = self.row(chunk_id)
+        return default if row is None else self.at(row)
+
+    def items(self):
+        return ((int(chunk_id), self.at(row)) for row, chunk_id in enumerate(self.ids))
+
+
+class MappedBM25Index:
+    """BM25 over memory-mapped postings; same read interface as BM25Index"""
+
+    def __init__(self, directory: Path, manifest: dict, ids: np.ndarray):
+        self.k1 = manifest["k1"]
+        self.b = manifest["b"]
+        self.total_length = manifest["total_length"]
+        self.ids = ids
+        self._terms = _map(directory / "terms.bin", np.uint8)
+        self._term_off = _map(directory / "terms.off", np.int64)
+        self._post_off = _map(directory / "post.off", np.int64)
+        self._post_row = _map(directory / "post.row", np.int32)
+        self._post_tf = _map(directory / "post.tf", np.int32)
+        self.doc_lengths = _map(directory / "doclen.i32", np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _term_at(self, t: int) -> str:
+        return bytes(self._terms[self._term_off[t]:self._term_off[t + 1]]).decode("utf-8")
+
+    def _find(self, term: str) -> Optional[int]:
+        """Binary search the sorted vocabulary without decoding all of it"""
+        lo, hi = 0, len(self._term_off) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._term_off) - 1 and self._term_at(lo) == term:
+            return lo
+        return None
+
+    def _postings(self, term: str):
+        t = self._find(term)
+        if t is None:
+            return None, None
+        start, end = self._post_off[t], self._post_off[t + 1]
+        return self._post_row[start:end], self._post_tf[start:end]
+
+    def _rows_of(self, doc_ids) -> np.ndarray:
+        """Rows of the given chunk ids; ids not in the snapshot are dropped"""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, doc_ids)
+        valid = rows < len(self.ids)
+        rows, doc_ids = rows[valid], doc_ids[valid]
+        return rows[self.ids[rows] == doc_ids].astype(np.int32)
+
+    def idf(self, term: str) -> float:
+        rows, _ = self._postings(term)
+        df = 0 if rows is None else len(rows)
+        n = len(self.ids)
+        return float(np.log(1 + (n - df + 0.5) / (df + 0.5)))
+
+    def search(self, query: str, limit: int = 3, doc_ids=None) -> list[tuple[int, float]]:
+        n = len(self.ids)
+        if n == 0:
+            return []
+        avg_length = self.total_length / n or 1.0
+        all_rows, all_scores = [], []
+        allowed_rows = None
+        if doc_ids is not None:
+            allowed_rows = self._rows_of(doc_ids)
+
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if rows is None:
+                continue
+            # idf comes from the full postings, so scoped scores match unscoped ones
+            idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            if allowed_rows is not None:
+                keep = np.isin(rows, allowed_rows, assume_unique=True)
+                rows, tfs = rows[keep], tfs[keep]
+                if len(rows) == 0:
+                    continue
+            tfs = tfs.astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[rows] / avg_length)
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not all_rows:
+            return []
+        # Sum contributions per row, touching only the postings we read
+        unique_rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argpartition(scores, -limit)[-limit:] if limit < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(self.ids[unique_rows[i]]), float(scores[i])) for i in top]
+
+    def to_index(self) -> BM25Index:
+        """Rebuild a mutable in-memory BM25Index from the mapped postings"""
+        index = BM25Index(self.k1, self.b)
+        ids = [int(i) for i in self.ids]
+        doc_terms: dict[int, list[str]] = {chunk_id: [] for chunk_id in ids}
+        for t in range(len(self._term_off) - 1):
+            term = self._term_at(t)
+            start, end = self._post_off[t], self._post_off[t + 1]
+            docs = {}
+            for row, tf in zip(self._post_row[start:end].tolist(), self._post_tf[start:end].tolist()):
+                docs[ids[row]] = tf
+                doc_terms[ids[row]].append(term)
+            index.postings[term] = docs
+        index.doc_lengths = {chunk_id: int(length) for chunk_id, length in zip(ids, self.doc_lengths)}
+        index.doc_terms = {chunk_id: tuple(terms) for chunk_id, terms in doc_terms.items()}
+        index.total_length = self.total_length
+        return index
+
+
+class MappedVectorIndex:
+    """Top-k over a memory-mapped embedding matrix; same read interface as VectorIndex"""
+
+    def __init__(self, directory: Path, dimension: int, ids: np.ndarray):
+        self.dimension = dimension
+        self.ids = ids
+        self._matrix = _map(directory / "vectors.f32", np.float32, shape=(len(ids), dimension))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: np.ndarray, limit: int = 3) -> list[tuple[int, float]]:
+        if len(self.ids) == 0 or limit <= 0:
+            return []
+        return top_k(self._matrix @ query, self.ids, limit)
+
+    def search_ids(self, query: np.ndarray, ids, limit: int = 3) -> list[tuple[int, float]]:
+        ids = np.asarray(sorted(ids), dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        valid = rows < len(self.ids)
+        rows, ids = rows[valid], ids[valid]
+        rows = rows[self.ids[rows] == ids]
+        if len(rows) == 0 or limit <= 0:
+            return []
+        return top_k(self._matrix[rows] @ query, self.ids[rows], limit)
+
+    def to_index(self) -> VectorIndex:
+        index = VectorIndex(self.dimension, initial_capacity=max(1024, len(self.ids)))
+        if len(self.ids):
+            index.add([int(i) for i in self.ids], np.asarray(self._matrix))
+        return index
+
+
+class MappedSnapshot:
+    def __init__(self, directory: Path):
+        with open(directory / "manifest.json", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.manifest.get('version')}")
+        self.chunks = MappedChunks(directory)
+        self.bm25 = MappedBM25Index(directory, self.manifest, self.chunks.ids)
+        self.metadata = MetadataIndex.load(directory, self.manifest["facets"])
+        self.vectors = None
+        if self.manifest.get("dimension"):
+            self.vectors = MappedVectorIndex(directory, self.manifest["dimension"], self.chunks.ids)
+
+
+def open_snapshot(directory: Path) -> Optional[MappedSnapshot]:
+    """Map an existing snapshot, or return None if there isn't a usable one"""
+    pointer = directory / POINTER
+    if not pointer.exists():
+        return None
+    directory = directory / pointer.read_text(encoding="utf-8").strip()
+    if not (directory / "manifest.json").exists():
+        return None
+    try:
+        start = time.perf_counter()
+        snapshot = MappedSnapshot(directory)
+        logger.info(
+            f"Mapped index snapshot of {len(snapshot.chunks)} chunks "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        return snapshot
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable index snapshot at {directory}: {e}")
+        return None
@@ -0,0 +1,215 @@
+"""
+Markdown Chunker - splits textbook chapters into retrieval-sized chunks.
+Works as a generator over lines, so a chapter streams through it once:
+headings and code fences define block boundaries, blocks are packed up to
+a token budget, and a small tail of each chunk is carried into the next.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Union
+import io
+import re
+
+from services.tokens import count_tokens
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# MDX boilerplate that every chapter page carries for the action buttons
+BOILERPLATE_PATTERNS = (
+    re.compile(r"^\s*import\s+\w+\s+from\s+['\"]@site/.*['\"];?\s*$"),
+    re.compile(r"^\s*<ChapterActions\s*/>\s*$"),
+)
+
+
+@dataclass
+class Chunk:
+    text: str
+    heading: str
+    index: int
+    token_count: int
+
+
+@dataclass
+class _Block:
+    text: str
+    tokens: int
+    is_code: bool = False
+
+
+def _iter_lines(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """Yield lines without trailing newlines from a string or open file."""
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    for line in lines:
+        yield line.rstrip("\r\n")
+
+
+def _strip_front_matter(lines: Iterator[str]) -> Iterator[str]:
+    """Drop a leading YAML front matter block and MDX boilerplate lines."""
+    first = next(lines, None)
+    if first is None:
+        return
+    if first.strip() == "---":
+        for line in lines:
+            if line.strip() == "---":
+                break
+    else:
+        lines = _prepend(first, lines)
+
+    for line in lines:
+        if not any(pattern.match(line) for pattern in BOILERPLATE_PATTERNS):
+            yield line
+
+
+def _prepend(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def _iter_blocks(lines: Iterator[str]) -> Iterator[tuple[str, Union[_Block, str]]]:
+    """
+    Group lines into blocks. Yields ("heading", line) for headings and
+    ("block", _Block) for paragraphs and whole code fences.
+    """
+    buffer: list[str] = []
+    fence = None
+
+    def flush(is_code: bool = False):
+        text = "\n".join(buffer).strip("\n")
+        buffer.clear()
+        if text.strip():
+            return _Block(text, count_tokens(text), is_code)
+        return None
+
+    for line in lines:
+        if fence is not None:
+            buffer.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                block = flush(is_code=True)
+                if block:
+                    yield "block", block
+            continue
+
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            block = flush()
+            if block:
+                yield "block", block
+            fence = fence_match.group(1)
+            buffer.append(line)
+            continue
+
+        heading_match = HEADING_PATTERN.match(line)
+        if heading_match:
+            block = flush()
+            if block:
+                yield "block", block
+            yield "heading", line.strip()
+            continue
+
+        if not line.strip():
+            block = flush()
+            if block:
+                yield "block", block
+            continue
+
+        buffer.append(line)
+
+    # An unterminated fence is still code
+    block = flush(is_code=fence is not None)
+    if block:
+        yield "block", block
+
+
+def _split_oversized(block: _Block, max_tokens: int) -> Iterator[_Block]:
+    """Split a block that exceeds the budget on sentences (prose) or lines (code)."""
+    pieces = block.text.split("\n") if block.is_code else SENTENCE_END.split(block.text)
+    joiner = "\n" if block.is_code else " "
+    current: list[str] = []
+    current_tokens = 0
+
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            text = joiner.join(current)
+            yield _Block(text, count_tokens(text), block.is_code)
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+
+    if current:
+        text = joiner.join(current)
+        yield _Block(text, count_tokens(text), block.is_code)
+
+
+def _overlap_tail(blocks: list[_Block], overlap_tokens: int) -> list[_Block]:
+    """Trailing prose carried into the next chunk, at most `overlap_tokens` long."""
+    if overlap_tokens <= 0 or not blocks or blocks[-1].is_code:
+        return []
+
+    tail: list[str] = []
+    used = 0
+    for sentence in reversed(SENTENCE_END.split(blocks[-1].text)):
+        tokens = count_tokens(sentence)
+        if used + tokens > overlap_tokens:
+            break
+        tail.insert(0, sentence)
+        used += tokens
+
+    if not tail:
+        return []
+    text = " ".join(tail)
+    return [_Block(text, used)]
+
+
+def chunk_markdown(
+    source: Union[str, Iterable[str]],
+    max_tokens: int = 400,
+    overlap_tokens: int = 50,
+) -> Iterator[Chunk]:
+    """
+    Yield chunks of a Markdown/MDX document.
+
+    `source` may be a string or any iterable of lines (such as an open file).
+    Chunks never cross a heading and never cut through a code fence unless
+    the fence alone is larger than `max_tokens`.
+    """
+    heading = ""
+    blocks: list[_Block] = []
+    tokens = 0
+    has_new_content = False
+    index = 0
+
+    def emit():
+        text = "\n\n".join(block.text for block in blocks)
+        return Chunk(text=text, heading=heading, index=index, token_count=tokens)
+
+    lines = _strip_front_matter(_iter_lines(source))
+    for kind, item in _iter_blocks(lines):
+        if kind == "heading":
+            if has_new_content:
+                yield emit()
+                index += 1
+                blocks, tokens = [], 0
+            # Consecutive headings stay together until some content arrives
+            heading = HEADING_PATTERN.match(item).group(2)
+            blocks.append(_Block(item, count_tokens(item)))
+            tokens += blocks[-1].tokens
+            has_new_content = False
+            continue
+
+        parts = [item] if item.tokens <= max_tokens else _split_oversized(item, max_tokens)
+        for block in parts:
+            if has_new_content and tokens + block.tokens > max_tokens:
+                yield emit()
+                index += 1
+                blocks = _overlap_tail(blocks, overlap_tokens)
+                tokens = sum(b.tokens for b in blocks)
+            blocks.append(block)
+            tokens += block.tokens
+            has_new_content = True
+
+    if has_new_content:
+        yield emit()
@@ -0,0 +1,294 @@
+"""
+Conversation Store - chat history keyed by conversation_id.
+Recent turns are kept verbatim up to a token budget; older turns are
+folded into a short running summary, so the history part of the prompt
+stays bounded however long a conversation runs. An in-memory LRU with a
+TTL holds active conversations and can write through to SQLite or
+Postgres (DATABASE_URL) so history survives restarts and evictions.
+"""
+
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from config import data_path, get_settings
+from services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+SUMMARY_WORDS_PER_TURN = 40
+ROLE_LABELS = {"user": "Student", "assistant": "Tutor"}
+
+
+@dataclass
+class Turn:
+    role: str  # "user" or "assistant"
+    text: str
+    tokens: int
+
+
+@dataclass
+class Conversation:
+    id: str
+    summary: str = ""
+    turns: list[Turn] = field(default_factory=list)
+    updated_at: float = 0.0
+
+    @property
+    def window_tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns)
+
+    def to_prompt(self) -> str:
+        """History formatted for the chat prompt ("" for a new conversation)"""
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier in this conversation:\n{self.summary}")
+        if self.turns:
+            parts.append("\n".join(f"{ROLE_LABELS[turn.role]}: {turn.text}" for turn in self.turns))
+        return "\n\n".join(parts)
+
+
+def _summarize_turn(turn: Turn) -> str:
+    """One short line per turn: the first sentence, clipped to a few dozen words"""
+    first = SENTENCE_END.split(turn.text.strip(), maxsplit=1)[0]
+    words = first.split()
+    if len(words) > SUMMARY_WORDS_PER_TURN:
+        first = " ".join(words[:SUMMARY_WORDS_PER_TURN]) + " ..."
+    return f"- {ROLE_LABELS[turn.role]}: {first}"
+
+
+class SQLConversationBackend:
+    """Write-through persistence; one row per conversation"""
+    placeholder = "?"
+    # Errors after which the connection is reopened and the statement retried once
+    reconnect_errors: tuple = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _run(self, sql: str, params: tuple):
+        cursor = self._db.execute(sql, params)
+        row = cursor.fetchone() if cursor.description else None
+        self._db.commit()
+        return row
+
+    def _execute(self, sql: str, params: tuple = ()):
+        sql = sql.replace("?", self.placeholder)
+        with self._lock:
+            try:
+                return self._run(sql, params)
+            except self.reconnect_errors as e:
+                # e.g. the server restarted or dropped an idle connection
+                logger.warning(f"Conversation store connection lost ({e}), reconnecting")
+                try:
+                    self._db.close()
+                except Exception:
+                    pass
+                self._db = self._connect()
+                return self._run(sql, params)
+
+    def load(self, conversation_id: str) -> Optional[Conversation]:
+        row = self._execute(
+            "SELECT summary, turns, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        )
+        if row is None:
+            return None
+        summary, turns, updated_at = row
+        return Conversation(conversation_id, summary, [Turn(**t) for t in json.loads(turns)], updated_at)
+
+    def save(self, conversation: Conversation):
+        self._execute(
+            "INSERT INTO conversations (id, summary, turns, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET summary = excluded.summary, "
+            "turns = excluded.turns, updated_at = excluded.updated_at",
+            (
+                conversation.id,
+                conversation.summary,
+                json.dumps([asdict(turn) for turn in conversation.turns], ensure_ascii=False),
+                conversation.updated_at
+            )
+        )
+
+    def prune(self, older_than: float):
+        self._execute("DELETE FROM conversations WHERE updated_at < ?", (older_than,))
+
+
+class SQLiteConversationBackend(SQLConversationBackend):
+    def __init__(self, path: str):
+        self.path = path
+        super().__init__()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+
+class PostgresConversationBackend(SQLConversationBackend):
+    placeholder = "%s"
+
+    def __init__(self, url: str):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError(
+                "DATABASE_URL is a Postgres URL but psycopg is not installed "
+                "(pip install psycopg[binary], see requirements.txt)"
+            ) from e
+        self._psycopg = psycopg
+        self.url = url
+        self.reconnect_errors = (psycopg.OperationalError,)
+        super().__init__()
+
+    def _connect(self):
+        return self._psycopg.connect(self.url)
+
+
+def _sqlite_path(database_url: str) -> str:
+    """Path of a sqlite:/// URL; relative paths live in the data directory"""
+    path = database_url[len("sqlite:///"):]
+    if path == ":memory:" or Path(path).is_absolute():
+        return path
+    return str(data_path(path))
+
+
+def create_conversation_backend(database_url: str) -> Optional[SQLConversationBackend]:
+    """
+    None (memory only), SQLite for sqlite:///path, Postgres for postgres(ql)://.
+    Raises RuntimeError naming the problem if the database cannot be opened.
+    """
+    if not database_url:
+        return None
+    scheme = database_url.split(":", 1)[0]
+    try:
+        if database_url.startswith("sqlite:///"):
+            return SQLiteConversationBackend(_sqlite_path(database_url))
+        if database_url.startswith(("postgres://", "postgresql://")):
+            return PostgresConversationBackend(database_url)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Could not open the {scheme} conversation store from DATABASE_URL: {e}") from e
+    raise ValueError(f"Unsupported DATABASE_URL scheme for conversations: {scheme}")
+
+
+class ConversationStore:
+    PRUNE_EVERY = 100  # backend writes between deletions of expired rows
+
+    def __init__(
+        self,
+        backend: Optional[SQLConversationBackend] = None,
+        max_items: int = 1000,
+        ttl_seconds: float = 3600,
+        window_tokens: int = 1000,
+        summary_tokens: int = 300
+    ):
+        self.backend = backend
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self._items: OrderedDict[str, Conversation] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+
+    def _expired(self, conversation: Conversation, now: float) -> bool:
+        return conversation.updated_at + self.ttl_seconds < now
+
+    def _evict_expired(self, now: float):
+        # The LRU order is also last-update order, so expired entries sit at the front
+        while self._items:
+            oldest = next(iter(self._items.values()))
+            if not self._expired(oldest, now):
+                break
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def _get(self, conversation_id: str) -> Optional[Conversation]:
+        """Caller holds the lock"""
+        now = time.time()
+        self._evict_expired(now)
+        conversation = self._items.get(conversation_id)
+        if conversation is None and self.backend is not None:
+            conversation = self.backend.load(conversation_id)
+            if conversation is not None and self._expired(conversation, now):
+                conversation = None
+        return conversation
+
+    def history(self, conversation_id: str) -> str:
+        """Summary plus recent turns, formatted for the prompt"""
+        with self._lock:
+            conversation = self._get(conversation_id)
+            return conversation.to_prompt() if conversation else ""
+
+    def append(self, conversation_id: str, question: str, answer: str):
+        """Record one question/answer exchange and compact the window if needed"""
+        with self._lock:
+            conversation = self._get(conversation_id) or Conversation(conversation_id)
+            for role, text in (("user", question), ("assistant", answer)):
+                conversation.turns.append(Turn(role, text, count_tokens(text)))
+            self._compact(conversation)
+            conversation.updated_at = time.time()
+
+            self._items[conversation_id] = conversation
+            self._items.move_to_end(conversation_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+            if self.backend is not None:
+                self.backend.save(conversation)
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self.backend.prune(time.time() - self.ttl_seconds)
+
+    def _compact(self, conversation: Conversation):
+        """Fold the oldest turns into the summary until the window fits its budget"""
+        lines = conversation.summary.splitlines() if conversation.summary else []
+        while conversation.turns and conversation.window_tokens > self.window_tokens:
+            lines.append(_summarize_turn(conversation.turns.pop(0)))
+        # The summary itself is capped too; its oldest lines go first
+        while lines and count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        conversation.summary = "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._items),
+            "evictions": self.evictions,
+            "persistent": self.backend is not None
+        }
+
+
+_conversation_store: Optional[ConversationStore] = None
+
+
+def get_conversation_store() -> ConversationStore:
+    global _conversation_store
+    if _conversation_store is None:
+        settings = get_settings()
+        _conversation_store = ConversationStore(
+            create_conversation_backend(settings.database_url),
+            max_items=settings.conversation_max_items,
+            ttl_seconds=settings.conversation_ttl_seconds,
+            window_tokens=settings.conversation_window_tokens,
+            summary_tokens=settings.conversation_summary_tokens
+        )
+    return _conversation_store
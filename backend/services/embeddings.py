@@ -0,0 +1,112 @@
+"""
+Embeddings - pluggable text embedders for dense retrieval.
+The hashing embedder needs no network or model download: it hashes word
+and character n-grams into a fixed number of buckets. The OpenAI embedder
+uses the model configured in Settings.openai_embedding_model.
+Both return L2-normalized float32 rows, so cosine similarity is a dot product.
+"""
+
+from collections import Counter
+from typing import Optional
+import logging
+import math
+import zlib
+
+import numpy as np
+
+from config import get_settings
+from services.search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class Embedder:
+    """Interface: turn a batch of texts into an (n, dimension) float32 matrix"""
+    name = "base"
+    dimension: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+class HashingEmbedder(Embedder):
+    """
+    Offline embedder using the hashing trick over word unigrams, word bigrams
+    and character trigrams. Each feature lands in a bucket picked by CRC32,
+    with a sign from another hash bit so collisions tend to cancel out.
+    """
+    name = "hashing"
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _features(self, text: str) -> Counter:
+        words = tokenize(text)
+        features = Counter(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dimension] += sign * (1.0 + math.log(count))
+        return _normalize_rows(matrix)
+
+
+class OpenAIEmbedder(Embedder):
+    name = "openai"
+
+    # Known output sizes; other models report theirs on first call
+    DIMENSIONS = {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536
+    }
+
+    def __init__(self, api_key: str, model: str, batch_size: int = 256):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key)
+        self.model = model
+        self.batch_size = batch_size
+        self.dimension = self.DIMENSIONS.get(model, 1536)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size]
+            )
+            rows.extend(item.embedding for item in response.data)
+        if not rows:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return _normalize_rows(np.asarray(rows, dtype=np.float32))
+
+
+def create_embedder(backend: Optional[str] = None) -> Embedder:
+    """Build the embedder named by Settings.embedding_backend"""
+    settings = get_settings()
+    backend = backend or settings.embedding_backend
+
+    if backend == "openai":
+        if not settings.openai_api_key:
+            raise ValueError("embedding_backend=openai requires OPENAI_API_KEY")
+        return OpenAIEmbedder(settings.openai_api_key, settings.openai_embedding_model)
+    if backend == "hashing":
+        return HashingEmbedder(settings.embedding_dimension)
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,152 @@
+"""
+Hybrid Search - lexical + vector candidates fused with reciprocal-rank fusion.
+Both candidate generators run in parallel, each under its own latency
+budget; a stage that misses its budget is simply left out of the fusion.
+Late stages are cancelled if they have not started, and no new stage is
+queued while the pool is still busy with late ones, so stale work never
+piles up; if no stage makes it, the lexical ranking is computed inline
+rather than prompting the model without context.
+A cheap local reranker then orders a small candidate set and drops chunks
+that score far below the best one, so fewer, better chunks reach the prompt.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import threading
+import time
+
+from services.metadata_index import Scope
+from services.search_index import BM25Index, tokenize
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+
+_POOL_WORKERS = 2
+_pool = ThreadPoolExecutor(max_workers=_POOL_WORKERS, thread_name_prefix="retrieval")
+# One slot per worker; a stage only starts when it can run right away
+_pool_slots = threading.BoundedSemaphore(_POOL_WORKERS)
+
+
+def _submit(fn, *args) -> Optional[Future]:
+    """Run `fn` on the retrieval pool, or None if every worker is busy"""
+    if not _pool_slots.acquire(blocking=False):
+        return None
+    future = _pool.submit(fn, *args)
+    future.add_done_callback(lambda _: _pool_slots.release())
+    return future
+
+
+@dataclass
+class HybridConfig:
+    candidates: int = 20
+    lexical_budget_ms: float = 50
+    vector_budget_ms: float = 50
+    rerank: bool = True
+    rerank_budget_ms: float = 20
+    min_score_ratio: float = 0.5
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def rerank_score(query_terms: list[str], idf: dict[str, float], text: str) -> float:
+    """
+    IDF-weighted coverage of the query terms, plus a bonus for query bigrams
+    that appear as phrases. Ranges roughly 0..1.5.
+    """
+    total = sum(idf.values())
+    if not total:
+        return 0.0
+    tokens = tokenize(text)
+    present = set(tokens)
+    coverage = sum(weight for term, weight in idf.items() if term in present) / total
+
+    query_bigrams = set(zip(query_terms, query_terms[1:]))
+    if not query_bigrams:
+        return coverage
+    text_bigrams = set(zip(tokens, tokens[1:]))
+    return coverage + 0.5 * len(query_bigrams & text_bigrams) / len(query_bigrams)
+
+
+class HybridSearcher:
+    def __init__(self, index: BM25Index, vectors, embedder, texts: dict, config: HybridConfig):
+        self.index = index
+        self.vectors = vectors
+        self.embedder = embedder
+        self.texts = texts  # chunk id -> chunk dict with "text"
+        self.config = config
+
+    def _lexical(self, query: str, scope: Optional[Scope]) -> list[int]:
+        doc_ids = None if scope is None else scope.ids.tolist()
+        return [doc_id for doc_id, _ in self.index.search(query, self.config.candidates, doc_ids)]
+
+    def _vector(self, query: str, scope: Optional[Scope]) -> list[int]:
+        query_vector = self.embedder.embed_one(query)
+        return [doc_id for doc_id, _ in self.vectors.search(query_vector, self.config.candidates, scope)]
+
+    def _collect(self, stages: list[tuple[str, Optional[Future], float]]) -> list[list[int]]:
+        """Wait for each stage until its own deadline; late stages are dropped"""
+        start = time.perf_counter()
+        rankings = []
+        for name, future, budget_ms in stages:
+            if future is None:
+                logger.warning(f"Hybrid search: {name} stage skipped, retrieval pool busy")
+                continue
+            remaining = budget_ms / 1000 - (time.perf_counter() - start)
+            try:
+                rankings.append(future.result(timeout=max(0.0, remaining)))
+            except TimeoutError:
+                # Drops it if still queued; a running one frees its slot when done
+                future.cancel()
+                logger.warning(f"Hybrid search: {name} stage missed its {budget_ms}ms budget")
+        return rankings
+
+    def search(self, query: str, limit: int = 3, scope: Optional[Scope] = None) -> list[tuple[int, float]]:
+        """Blocks for up to the stage budgets; async callers run it in a thread"""
+        rankings = self._collect([
+            ("lexical", _submit(self._lexical, query, scope), self.config.lexical_budget_ms),
+            ("vector", _submit(self._vector, query, scope), self.config.vector_budget_ms)
+        ])
+        if not rankings:
+            rankings = [self._lexical(query, scope)]
+        # Drop ids with no local chunk (stale points in a shared or older
+        # Qdrant collection) before they take a candidate slot
+        rankings = [[doc_id for doc_id in ranking if doc_id in self.texts] for ranking in rankings]
+        fused = reciprocal_rank_fusion(rankings)[:self.config.candidates]
+        if not self.config.rerank or not fused:
+            return fused[:limit]
+        return self._rerank(query, fused, limit)
+
+    def _rerank(self, query: str, fused: list[tuple[int, float]], limit: int) -> list[tuple[int, float]]:
+        query_terms = tokenize(query)
+        idf = {term: self.index.idf(term) for term in set(query_terms)}
+        deadline = time.perf_counter() + self.config.rerank_budget_ms / 1000
+
+        scored = []
+        unscored = []
+        for position, (doc_id, fused_score) in enumerate(fused):
+            if time.perf_counter() > deadline:
+                # Out of budget: the rest keep their fused order and scores,
+                # after the reranked ones and outside the score-ratio cut
+                unscored = fused[position:]
+                break
+            score = rerank_score(query_terms, idf, self.texts[doc_id]["text"])
+            scored.append((doc_id, score, fused_score))
+
+        scored.sort(key=lambda item: (item[1], item[2]), reverse=True)
+        best = scored[0][1] if scored else 0.0
+        results = [
+            (doc_id, score)
+            for doc_id, score, _ in scored
+            if best <= 0 or score >= best * self.config.min_score_ratio
+        ]
+        return (results + list(unscored))[:limit]
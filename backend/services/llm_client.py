@@ -0,0 +1,344 @@
+"""
+LLM Client - the one place the backend talks to the language model.
+Chat, translation and personalization share a single provider (Gemini,
+OpenAI or the offline stub; see llm_providers.py) and so one pooled
+connection, the model settings, one global concurrency limit and per-call
+timeouts. Failures are mapped to LLMError with a user-safe message, so
+the services no longer string-match SDK errors themselves.
+
+Provider calls are synchronous, so async callers run them on a bounded
+thread pool and never block uvicorn's event loop.
+Every call first takes quota from the shared RateLimiter (see
+rate_limiter.py) and is retried with backoff when Gemini answers 429.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+
+from config import get_settings
+from services.llm_providers import LLMProvider, create_llm_provider
+from services.metrics import (
+    LLM_CALLS, LLM_FIRST_TOKEN_SECONDS, LLM_IN_FLIGHT, LLM_QUEUE_WAITING, LLM_RATE_LIMITED,
+    LLM_RATE_SCALE, LLM_TOKENS, STAGE_SECONDS
+)
+from services.tracing import span
+from services.rate_limiter import PRIORITY_CHAT, QueueTimeout, RateLimiter, backoff_delay
+from services.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_TOKEN_ESTIMATE = 512
+
+# Error kinds
+NOT_CONFIGURED = "not_configured"
+RATE_LIMITED = "rate_limited"
+AUTH = "auth"
+TIMEOUT = "timeout"
+UNAVAILABLE = "unavailable"
+
+USER_MESSAGES = {
+    NOT_CONFIGURED: "Please configure the Gemini API key in backend/.env",
+    RATE_LIMITED: "⏳ I'm receiving too many requests right now. Please wait a moment and try again.",
+    AUTH: "🔑 API configuration issue. Please contact the administrator.",
+    TIMEOUT: "⏱️ The request timed out. Please try again.",
+    UNAVAILABLE: "😅 Sorry, I encountered an issue. Please try again in a moment.",
+}
+
+
+class LLMError(Exception):
+    """A model call failed. `kind` says why; `user_message` is safe to show."""
+
+    def __init__(self, kind: str, detail: str = ""):
+        super().__init__(detail or kind)
+        self.kind = kind
+        self.user_message = USER_MESSAGES[kind]
+
+
+def map_error(e: Exception) -> LLMError:
+    """Classify an SDK exception by HTTP status where it has one, else by message"""
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError)):
+        return LLMError(TIMEOUT, str(e))
+
+    # google.api_core errors carry `code`, openai errors `status_code`
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(e, "status_code", None)
+    code = code if isinstance(code, int) else None
+    text = str(e).lower()
+    if code == 429 or any(m in text for m in ("429", "quota", "rate limit", "resource exhausted", "too many requests")):
+        kind = RATE_LIMITED
+    elif code in (401, 403) or "api key" in text or "authentication" in text or "permission" in text:
+        kind = AUTH
+    elif code == 504 or "timeout" in text or "timed out" in text or "deadline" in text:
+        kind = TIMEOUT
+    else:
+        kind = UNAVAILABLE
+    return LLMError(kind, f"{type(e).__name__}: {e}")
+
+
+class LLMClient:
+    def __init__(
+        self,
+        provider: Optional[LLMProvider],
+        max_concurrency: int = 8,
+        timeout_seconds: float = 60,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = 3,
+        queue_timeout_seconds: Optional[float] = 30
+    ):
+        self.provider = provider
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max(1, max_concurrency)
+        # Every call, sync or async, holds a slot; the pool is the same size
+        # so async calls queue in the executor rather than in a blocked thread
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.limiter = limiter or RateLimiter(0)
+        self.max_retries = max(0, max_retries)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        # Output size is unknown until the call returns; reserve this much
+        self.output_token_estimate = (provider and provider.max_output_tokens) or OUTPUT_TOKEN_ESTIMATE
+        self.provider_name = provider.name if provider is not None else "none"
+        LLM_QUEUE_WAITING.function = lambda: self.limiter.stats()["waiting"]
+        LLM_RATE_SCALE.function = lambda: self.limiter.rate_scale
+        if provider is not None:
+            logger.info(
+                f"LLM client ready: {provider.name}/{provider.model_name}, "
+                f"up to {self.max_concurrency} concurrent calls"
+            )
+
+    @property
+    def configured(self) -> bool:
+        return self.provider is not None
+
+    def _executor_pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm")
+            return self._executor
+
+    def _failed(self, e: Exception) -> LLMError:
+        error = map_error(e)
+        LLM_CALLS.inc(self.provider_name, error.kind)
+        if error.kind == RATE_LIMITED:
+            LLM_RATE_LIMITED.inc(self.provider_name)
+        return error
+
+    def _call(self, prompt: str, queued_at: float) -> str:
+        """`queued_at` is when the caller started waiting for quota"""
+        if self.provider is None:
+            raise LLMError(NOT_CONFIGURED)
+        with self._slots:
+            start = time.perf_counter()
+            STAGE_SECONDS.observe(start - queued_at, "llm_wait")
+            LLM_IN_FLIGHT.inc()
+            try:
+                with span("llm.call", provider=self.provider_name, wait_ms=round((start - queued_at) * 1000, 3)):
+                    text = self.provider.generate(prompt, self.timeout_seconds or None)
+            except Exception as e:
+                raise self._failed(e) from e
+            finally:
+                LLM_IN_FLIGHT.dec()
+                STAGE_SECONDS.observe(time.perf_counter() - start, "llm_generate")
+            LLM_CALLS.inc(self.provider_name, "ok")
+            return text
+
+    def _stream(self, prompt: str, queued_at: float) -> Iterator[str]:
+        if self.provider is None:
+            raise LLMError(NOT_CONFIGURED)
+        with self._slots:
+            start = time.perf_counter()
+            STAGE_SECONDS.observe(start - queued_at, "llm_wait")
+            LLM_IN_FLIGHT.inc()
+            first = True
+            try:
+                with span("llm.stream", provider=self.provider_name, wait_ms=round((start - queued_at) * 1000, 3)) as call:
+                    for text in self.provider.stream(prompt, self.timeout_seconds or None):
+                        if first:
+                            first_token = time.perf_counter() - start
+                            LLM_FIRST_TOKEN_SECONDS.observe(first_token)
+                            if call is not None:
+                                call.set(first_token_ms=round(first_token * 1000, 3))
+                            first = False
+                        yield text
+            except Exception as e:
+                raise self._failed(e) from e
+            finally:
+                LLM_IN_FLIGHT.dec()
+                STAGE_SECONDS.observe(time.perf_counter() - start, "llm_generate")
+            LLM_CALLS.inc(self.provider_name, "ok")
+
+    def _estimate(self, prompt_tokens: int) -> int:
+        """Quota to reserve: the prompt plus the expected answer"""
+        return prompt_tokens + self.output_token_estimate
+
+    def _retry_delay(self, e: LLMError, attempt: int) -> Optional[float]:
+        """Backoff before the next attempt, or None if this error is final"""
+        if e.kind != RATE_LIMITED or attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt)
+        self.limiter.on_rate_limited(delay)
+        return delay
+
+    def _succeeded(self, estimate: int, prompt_tokens: int, text: str):
+        completion_tokens = count_tokens(text)
+        LLM_TOKENS.inc("prompt", amount=prompt_tokens)
+        LLM_TOKENS.inc("completion", amount=completion_tokens)
+        self.limiter.on_success()
+        self.limiter.settle(estimate, prompt_tokens + completion_tokens)
+
+    def _queue_timeout(self, e: QueueTimeout) -> LLMError:
+        LLM_CALLS.inc(self.provider_name, "queue_timeout")
+        return LLMError(RATE_LIMITED, str(e))
+
+    def generate(self, prompt: str, priority: int = PRIORITY_CHAT) -> str:
+        """Blocking call; raises LLMError"""
+        prompt_tokens = count_tokens(prompt)
+        estimate = self._estimate(prompt_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                queued_at = time.perf_counter()
+                with span("llm.wait", priority=priority, attempt=attempt):
+                    self.limiter.acquire_blocking(estimate, priority, self.queue_timeout_seconds)
+                text = self._call(prompt, queued_at)
+            except QueueTimeout as e:
+                raise self._queue_timeout(e) from e
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(estimate, prompt_tokens, text)
+            return text
+
+    async def generate_async(self, prompt: str, priority: int = PRIORITY_CHAT) -> str:
+        """Run the call on the LLM thread pool; raises LLMError"""
+        prompt_tokens = count_tokens(prompt)
+        estimate = self._estimate(prompt_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                queued_at = time.perf_counter()
+                with span("llm.wait", priority=priority, attempt=attempt):
+                    await self.limiter.acquire(estimate, priority, self.queue_timeout_seconds)
+                text = await self._run(self._call, prompt, queued_at)
+            except QueueTimeout as e:
+                raise self._queue_timeout(e) from e
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(estimate, prompt_tokens, text)
+            return text
+
+    async def stream_async(self, prompt: str, priority: int = PRIORITY_CHAT) -> AsyncIterator[str]:
+        """
+        Yield text pieces as the model produces them; raises LLMError.
+        A 429 is retried only before the first piece has been sent.
+        """
+        prompt_tokens = count_tokens(prompt)
+        estimate = self._estimate(prompt_tokens)
+        pieces = []
+        for attempt in range(self.max_retries + 1):
+            try:
+                queued_at = time.perf_counter()
+                with span("llm.wait", priority=priority, attempt=attempt):
+                    await self.limiter.acquire(estimate, priority, self.queue_timeout_seconds)
+                async for text in self._iterate(self._stream, prompt, queued_at):
+                    pieces.append(text)
+                    yield text
+            except QueueTimeout as e:
+                raise self._queue_timeout(e) from e
+            except LLMError as e:
+                delay = None if pieces else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(estimate, prompt_tokens, "".join(pieces))
+            return
+
+    async def _run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry context variables (the current span) over; do it here
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor_pool(), partial(context.run, fn, *args, **kwargs))
+
+    async def _iterate(self, fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Drive a blocking iterator on the LLM thread pool, yielding each item
+        as soon as it arrives. If the consumer stops early, the worker stops
+        pulling from the model.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop already closed; nobody is listening
+                stop.set()
+
+        def produce():
+            iterator = fn(*args, **kwargs)
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        return
+                    put(item)
+            except Exception as e:
+                put(done, e)
+            else:
+                put(done)
+            finally:
+                iterator.close()
+
+        loop.run_in_executor(self._executor_pool(), contextvars.copy_context().run, produce)
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            stop.set()
+
+
+_llm_client: Optional[LLMClient] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            settings = get_settings()
+            _llm_client = LLMClient(
+                create_llm_provider(),
+                max_concurrency=settings.llm_max_concurrency,
+                timeout_seconds=settings.llm_timeout_seconds,
+                limiter=RateLimiter(
+                    settings.llm_requests_per_minute,
+                    settings.llm_tokens_per_minute,
+                    burst_seconds=settings.llm_burst_seconds
+                ),
+                max_retries=settings.llm_max_retries,
+                queue_timeout_seconds=settings.llm_queue_timeout_seconds or None
+            )
+        return _llm_client
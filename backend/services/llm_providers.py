@@ -0,0 +1,209 @@
+"""
+LLM Providers - pluggable text generation backends behind LLMClient.
+Gemini is the default (free tier). OpenAI uses Settings.openai_chat_model.
+The stub provider needs no network or API key: it writes deterministic
+text from the prompt at a configurable latency and token rate, so the
+whole FastAPI stack (concurrency, caching, streaming) can be load-tested
+offline.
+Providers only make the call; LLMClient adds concurrency limits, quota,
+retries and error mapping on top.
+"""
+
+from typing import Iterator, Optional
+import logging
+import random
+import re
+import time
+import zlib
+
+from config import get_settings
+from services.search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# A line the prompt asks the model to copy through verbatim, e.g. <<<BLOCK_0>>>
+PLACEHOLDER_PATTERN = re.compile(r"^<<<\w+>>>$", re.MULTILINE)
+
+
+class LLMProvider:
+    """Interface: generate text for a prompt, whole or as a stream of pieces"""
+    name = "base"
+    model_name: str = ""
+    max_output_tokens: Optional[int] = None
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. safety metadata only)
+        return ""
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None
+    ):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        generation_config = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        if max_output_tokens:
+            generation_config["max_output_tokens"] = max_output_tokens
+        self.model_name = model_name
+        self.max_output_tokens = max_output_tokens
+        self.model = genai.GenerativeModel(model_name, generation_config=generation_config or None)
+
+    def _request_options(self, timeout: Optional[float]) -> Optional[dict]:
+        return {"timeout": timeout} if timeout else None
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        response = self.model.generate_content(prompt, request_options=self._request_options(timeout))
+        return response.text
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        response = self.model.generate_content(prompt, stream=True, request_options=self._request_options(timeout))
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None
+    ):
+        from openai import OpenAI
+        # LLMClient does the retrying, with the shared rate limiter
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+
+    def _create(self, prompt: str, timeout: Optional[float], stream: bool):
+        options = {}
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        if self.max_output_tokens:
+            options["max_tokens"] = self.max_output_tokens
+        return self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=stream,
+            timeout=timeout,
+            **options
+        )
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        response = self._create(prompt, timeout, stream=False)
+        return response.choices[0].message.content or ""
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        for chunk in self._create(prompt, timeout, stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider for tests and benchmarks. The answer is built from the
+    prompt's own words with a generator seeded by its hash, so the same
+    prompt always gets the same answer. It arrives after `latency_ms`, then
+    at `tokens_per_second` (one word is one token); generate() takes as long
+    as streaming the whole answer would. Placeholder lines in the prompt
+    (<<<BLOCK_0>>>) are kept, in order, at the end of a generated answer.
+    """
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: float = 200,
+        tokens_per_second: float = 50,
+        response_tokens: int = 120,
+        max_output_tokens: Optional[int] = None
+    ):
+        self.model_name = "stub"
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = min(response_tokens, max_output_tokens or response_tokens)
+        self.max_output_tokens = max_output_tokens
+
+    def _words(self, prompt: str) -> list[str]:
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        vocabulary = tokenize(prompt) or ["stub"]
+        return [rng.choice(vocabulary) for _ in range(self.response_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        words = self._words(prompt)
+        time.sleep(self.latency_ms / 1000 + len(words) * self._token_delay())
+        placeholders = PLACEHOLDER_PATTERN.findall(prompt)
+        return "\n".join([" ".join(words), *placeholders])
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        words = self._words(prompt)
+        delay = self._token_delay()
+        time.sleep(self.latency_ms / 1000)
+        for i, word in enumerate(words):
+            if delay:
+                time.sleep(delay)
+            yield word if i == 0 else f" {word}"
+
+
+def create_llm_provider(provider: Optional[str] = None) -> Optional[LLMProvider]:
+    """
+    Build the provider named by Settings.llm_provider, or None when its API
+    key is missing (calls then fail as not configured).
+    """
+    settings = get_settings()
+    provider = provider or settings.llm_provider
+
+    if provider == "gemini":
+        if not settings.gemini_api_key:
+            logger.warning("Gemini API key not configured")
+            return None
+        return GeminiProvider(
+            settings.gemini_api_key,
+            settings.llm_model,
+            settings.llm_temperature,
+            settings.llm_max_output_tokens
+        )
+    if provider == "openai":
+        if not settings.openai_api_key:
+            logger.warning("OpenAI API key not configured")
+            return None
+        return OpenAIProvider(
+            settings.openai_api_key,
+            settings.openai_chat_model,
+            settings.llm_temperature,
+            settings.llm_max_output_tokens
+        )
+    if provider == "stub":
+        return StubProvider(
+            settings.stub_latency_ms,
+            settings.stub_tokens_per_second,
+            settings.stub_response_tokens,
+            settings.llm_max_output_tokens
+        )
+    raise ValueError(f"Unknown LLM provider: {provider}")
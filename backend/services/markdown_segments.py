@@ -0,0 +1,167 @@
+"""
+Markdown Segments - splits a chapter into translatable prose and
+pass-through blocks (front matter, code fences, mermaid, math, MDX lines).
+Segments keep their exact original text, so joining them in order gives
+back the input document byte for byte.
+"""
+
+from dataclasses import dataclass
+import re
+
+from services.tokens import count_tokens
+
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+MDX_LINE_PATTERN = re.compile(r"^\s*(import\s.+\sfrom\s.+|export\s.+|<[A-Z]\w*[^>]*/>)\s*$")
+
+PROSE = "prose"
+CODE = "code"
+MATH = "math"
+PASSTHROUGH = "passthrough"
+
+
+@dataclass
+class Segment:
+    kind: str
+    text: str
+
+    @property
+    def translatable(self) -> bool:
+        return self.kind == PROSE and bool(self.text.strip())
+
+
+def split_segments(content: str, max_tokens: int = 800) -> list[Segment]:
+    """
+    Split Markdown into ordered segments. Consecutive heading sections are
+    packed into one prose segment until it reaches `max_tokens`; it is then
+    cut at its last heading, or at a paragraph break if it has none, so the
+    largest segment (and the slowest translation call) stays bounded
+    without spending a model call on every short section.
+    """
+    segments: list[Segment] = []
+    prose: list[str] = []
+    prose_tokens = 0
+    # Where the last heading starts in `prose`, and the tokens before it
+    heading_at = 0
+    heading_tokens = 0
+
+    def flush_prose(upto: int = 0):
+        """Emit prose[:upto] (all of it by default) as a segment"""
+        nonlocal prose_tokens, heading_at
+        upto = upto or len(prose)
+        if upto:
+            text = "".join(prose[:upto])
+            segments.append(Segment(PROSE if text.strip() else PASSTHROUGH, text))
+            del prose[:upto]
+        prose_tokens = prose_tokens - heading_tokens if prose else 0
+        heading_at = 0
+
+    def add_block(kind: str, text: str):
+        flush_prose()
+        if segments and segments[-1].kind == kind:
+            segments[-1].text += text
+        else:
+            segments.append(Segment(kind, text))
+
+    lines = content.splitlines(keepends=True)
+    i = 0
+
+    # YAML front matter
+    if lines and lines[0].strip() == "---":
+        for j in range(1, len(lines)):
+            if lines[j].strip() == "---":
+                add_block(PASSTHROUGH, "".join(lines[:j + 1]))
+                i = j + 1
+                break
+
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        fence = FENCE_PATTERN.match(line)
+        if fence:
+            # Code and mermaid fences run to the matching closing fence
+            marker = fence.group(1)
+            j = i + 1
+            while j < len(lines) and not lines[j].strip().startswith(marker):
+                j += 1
+            add_block(CODE, "".join(lines[i:j + 1]))
+            i = j + 1
+            continue
+
+        if stripped.startswith("$$"):
+            # Display math, on one line ($$ x $$) or spanning several
+            j = i
+            if not (len(stripped) > 2 and stripped.endswith("$$")):
+                j = i + 1
+                while j < len(lines) and not lines[j].strip().endswith("$$"):
+                    j += 1
+            # An unclosed $$ is just text, not math swallowing the rest
+            if j < len(lines):
+                add_block(MATH, "".join(lines[i:j + 1]))
+                i = j + 1
+                continue
+
+        if MDX_LINE_PATTERN.match(line):
+            add_block(PASSTHROUGH, line)
+            i += 1
+            continue
+
+        if HEADING_PATTERN.match(stripped) and prose_tokens:
+            if prose_tokens >= max_tokens:
+                flush_prose()
+            else:
+                heading_at, heading_tokens = len(prose), prose_tokens
+        elif not stripped and prose_tokens >= max_tokens:
+            prose.append(line)
+            # Prefer keeping the current section whole in the next segment
+            flush_prose(heading_at)
+            i += 1
+            continue
+
+        prose.append(line)
+        prose_tokens += count_tokens(line)
+        i += 1
+
+    flush_prose()
+    return segments
+
+
+def group_segments(segments: list[Segment], max_tokens: int = 800) -> list[list[Segment]]:
+    """
+    Pack consecutive segments into groups whose prose totals at most
+    `max_tokens`, so the short code, math and MDX blocks between sections
+    no longer force a separate model call for every stretch of prose.
+    A group starts and ends with prose; blocks that do not sit between two
+    prose segments of the same group are groups of their own. Concatenating
+    the groups gives back `segments` in order.
+    """
+    groups: list[list[Segment]] = []
+    current: list[Segment] = []
+    current_tokens = 0
+    # Blocks seen since the last prose segment
+    gap: list[Segment] = []
+
+    for segment in segments:
+        if not segment.translatable:
+            if current:
+                gap.append(segment)
+            else:
+                groups.append([segment])
+            continue
+
+        tokens = count_tokens(segment.text)
+        if current and current_tokens + tokens <= max_tokens:
+            current += gap + [segment]
+            current_tokens += tokens
+        else:
+            if current:
+                groups.append(current)
+            groups.extend([block] for block in gap)
+            current, current_tokens = [segment], tokens
+        gap = []
+
+    if current:
+        groups.append(current)
+    groups.extend([block] for block in gap)
+    return groups
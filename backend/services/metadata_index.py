@@ -0,0 +1,130 @@
+"""
+Metadata Index - chunk-id bitmaps per metadata value (chapter, source).
+A scoped query ANDs the bitmaps of its filters once and then only scores
+the chunks that survive, instead of searching the whole corpus and
+throwing most of the results away.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+INDEXED_FIELDS = ("chapter", "source")
+
+
+def _bitmap_from_ids(ids) -> int:
+    """Pack chunk ids into a Python int with bit i set for chunk i"""
+    ids = np.fromiter(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return 0
+    bits = np.zeros(int(ids.max()) + 1, dtype=np.uint8)
+    bits[ids] = 1
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def bitmap_ids(bitmap: int) -> np.ndarray:
+    """Chunk ids set in a bitmap, ascending"""
+    if not bitmap:
+        return np.zeros(0, dtype=np.int64)
+    raw = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder="little")).astype(np.int64)
+
+
+@dataclass
+class Scope:
+    """
+    A resolved metadata filter: `filters` for stores that filter on their own
+    payloads (Qdrant), `ids` (ascending chunk ids) for the local indexes.
+    """
+    filters: dict[str, str]
+    ids: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class MetadataIndex:
+    def __init__(self):
+        # field -> value -> chunk ids; bitmaps are derived lazily and cached
+        self._members: dict[str, dict[str, set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        self._bitmaps: dict[tuple[str, str], int] = {}
+
+    def copy(self) -> "MetadataIndex":
+        """Independent copy, e.g. to snapshot without holding a lock"""
+        index = MetadataIndex()
+        index._members = {
+            field: {value: set(members) for value, members in values.items()}
+            for field, values in self._members.items()
+        }
+        return index
+
+    def add(self, chunk_id: int, metadata: dict):
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            if value:
+                self._members[field].setdefault(value, set()).add(chunk_id)
+                self._bitmaps.pop((field, value), None)
+
+    def remove(self, chunk_id: int, metadata: dict):
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            members = self._members[field].get(value)
+            if members is not None:
+                members.discard(chunk_id)
+                if not members:
+                    del self._members[field][value]
+                self._bitmaps.pop((field, value), None)
+
+    def values(self, field: str) -> list[str]:
+        return sorted(self._members[field])
+
+    def bitmap(self, field: str, value: str) -> int:
+        key = (field, value)
+        if key not in self._bitmaps:
+            self._bitmaps[key] = _bitmap_from_ids(self._members[field].get(value, ()))
+        return self._bitmaps[key]
+
+    def select(self, **filters: Optional[str]) -> Optional[int]:
+        """AND together the bitmaps of the given filters; None means unfiltered"""
+        result = None
+        for field, value in filters.items():
+            if value is None:
+                continue
+            bitmap = self.bitmap(field, value)
+            result = bitmap if result is None else result & bitmap
+        return result
+
+    def scope(self, **filters: Optional[str]) -> Optional[Scope]:
+        """Resolve filters to a Scope, or None when no filter is set"""
+        filters = {field: value for field, value in filters.items() if value is not None}
+        bitmap = self.select(**filters)
+        if bitmap is None:
+            return None
+        return Scope(filters, bitmap_ids(bitmap))
+
+    def save(self, directory: Path) -> dict:
+        """Write member lists as one flat int64 file; returns the offsets for the manifest"""
+        offsets: dict[str, dict[str, list[int]]] = {}
+        arrays = []
+        position = 0
+        for field, values in self._members.items():
+            offsets[field] = {}
+            for value, members in sorted(values.items()):
+                ids = np.asarray(sorted(members), dtype=np.int64)
+                offsets[field][value] = [position, position + len(ids)]
+                arrays.append(ids)
+                position += len(ids)
+        data = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+        data.tofile(directory / "facets.i64")
+        return offsets
+
+    @classmethod
+    def load(cls, directory: Path, offsets: dict) -> "MetadataIndex":
+        index = cls()
+        path = directory / "facets.i64"
+        data = np.fromfile(path, dtype=np.int64) if path.stat().st_size else np.zeros(0, dtype=np.int64)
+        for field, values in offsets.items():
+            for value, (start, end) in values.items():
+                index._members.setdefault(field, {})[value] = set(data[start:end].tolist())
+        return index
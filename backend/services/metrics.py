@@ -0,0 +1,246 @@
+"""
+Metrics - counters, gauges and histograms served at /metrics in the
+Prometheus text format.
+Recording takes no lock: every thread (the event loop, each LLM worker)
+updates its own shard of a metric, and a scrape adds the shards up. Cache
+hit/miss counts are not recorded at all on the hot path; the caches
+already keep them, so they are read from cache.stats() at scrape time.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+import threading
+import time
+
+# Seconds; spans cache hits (~1ms) through slow model calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY: list["_Metric"] = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        """This thread's series; the lock is only taken the first time a thread records"""
+        try:
+            return self._local.series
+        except AttributeError:
+            series = self._local.series = {}
+            with self._shards_lock:
+                self._shards.append(series)
+            return series
+
+    def _snapshots(self) -> list[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict.copy() is atomic under the GIL, so a writer never tears it
+        return [shard.copy() for shard in shards]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _totals(self) -> dict[tuple, float]:
+        totals: dict[tuple, float] = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def value(self, *labels) -> float:
+        return self._totals().get(labels, 0)
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._totals().items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """A counter that can go down, or a value read from a function at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def _totals(self) -> dict[tuple, float]:
+        if self.function is not None:
+            return {(): self.function()}
+        return super()._totals()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # One count per bucket plus +Inf, then sum and count
+            series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def time(self, *labels) -> "_Timer":
+        """with histogram.time("search"): ..."""
+        return _Timer(self, labels)
+
+    def _totals(self) -> dict[tuple, list]:
+        totals: dict[tuple, list] = {}
+        for shard in self._snapshots():
+            for labels, series in shard.items():
+                series = list(series)
+                total = totals.get(labels)
+                totals[labels] = series if total is None else [a + b for a, b in zip(total, series)]
+        return totals
+
+    def _samples(self) -> Iterable[str]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, series in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {series[-1]}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+# Caches report hits/misses through their own stats(); see register_cache
+_caches: dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Expose a cache whose stats() has "hits" and "misses" as cache_*_total{cache=name}"""
+    _caches[name] = stats
+
+
+def _cache_lines() -> list[str]:
+    lines = []
+    for kind in ("hits", "misses"):
+        name = f"cache_{kind}_total"
+        lines += [f"# HELP {name} Cache lookups that {'found' if kind == 'hits' else 'missed'} an entry",
+                  f"# TYPE {name} counter"]
+        for cache, stats in sorted(_caches.items()):
+            lines.append(f'{name}{{cache="{cache}"}} {stats()[kind]}')
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(_cache_lines())
+    return "\n".join(lines) + "\n"
+
+
+# Request stages: search, prompt (assembly), llm_wait (quota queue and
+# worker slot), llm_generate (the model call itself)
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each request stage", ("stage",))
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_first_token_seconds", "Time from starting a streamed model call to its first piece"
+)
+LLM_CALLS = Counter("llm_calls_total", "Model calls by outcome (ok or an error kind)", ("provider", "outcome"))
+LLM_RATE_LIMITED = Counter("llm_rate_limited_total", "429 responses from the model provider", ("provider",))
+LLM_TOKENS = Counter("llm_tokens_total", "Prompt and completion tokens of successful calls", ("type",))
+LLM_IN_FLIGHT = Gauge("llm_calls_in_flight", "Model calls currently running")
+# Read from the LLM client's rate limiter; see LLMClient
+LLM_QUEUE_WAITING = Gauge("llm_queue_waiting", "Model calls waiting for rate limiter quota")
+LLM_RATE_SCALE = Gauge("llm_rate_scale", "Share of the configured quota the rate limiter currently allows")
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("route", "status"))
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "HTTP request time until the response body ends", ("route",))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request through to the end of its body (so streams count fully)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The route template, not the raw path, so labels stay bounded
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, route)
+            HTTP_REQUESTS.inc(route, str(status))
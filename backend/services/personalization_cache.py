@@ -0,0 +1,60 @@
+"""
+Personalization Cache - in-memory TTL + LRU cache for personalized content.
+The profile space is tiny (a few levels x backgrounds x example languages),
+so thousands of readers on one chapter map onto a handful of outputs.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PersonalizationCache:
+    def __init__(self, max_items: int = 1024, ttl_seconds: float = 86400):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._items[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "items": len(self._items)
+        }
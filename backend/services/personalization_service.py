@@ -3,44 +3,103 @@ Personalization Service - Adapts content based on user profile.
 Uses Google Gemini API for intelligent content adaptation (FREE tier available).
 """
 
-import google.generativeai as genai
 from config import get_settings
+from services.llm_client import LLMError, get_llm_client
+from services.rate_limiter import PRIORITY_CONTENT
+from services.personalization_cache import PersonalizationCache
+from services.single_flight import SingleFlight
+from services.metrics import register_cache
+from services.tracing import span
 from dataclasses import dataclass
+import asyncio
+import hashlib
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EXPERIENCE_LEVELS = ("beginner", "intermediate", "advanced")
+BACKGROUNDS = ("cs", "engineering", "physics", "other")
+EXAMPLE_LANGUAGES = ("python", "cpp", "both")
+# Other spellings, including the frontend's signup answers
+BACKGROUND_ALIASES = {
+    "software": "cs", "student": "cs", "webdev": "cs", "data": "cs", "ml": "cs",
+    "hardware": "engineering", "systems": "engineering", "none": "other"
+}
+EXAMPLE_ALIASES = {"c++": "cpp", "c": "cpp"}
+# The signup interests plus the frontend's defaults; anything else is dropped
+INTERESTS = frozenset({
+    "robotics", "ai", "ai/ml", "robotics hardware", "computer vision", "control systems",
+    "humanoids", "drones", "autonomous vehicles"
+})
+MAX_INTERESTS = 3
+# What the frontend sends for readers without interests (sorted, as canonical)
+DEFAULT_INTERESTS = ("ai", "robotics")
+
+# Bump when the prompt changes so cached outputs from the old prompt are not reused
+PROMPT_VERSION = "1"
+
 
 @dataclass
 class UserProfile:
     experience_level: str  # beginner, intermediate, advanced
-    background: str  # software, hardware, both
+    background: str  # cs, engineering, physics, other
     interests: list[str]
-    preferred_examples: str = "python"  # python, cpp, pseudocode
+    preferred_examples: str = "python"  # python, cpp, both
+    
+    def canonical(self) -> "UserProfile":
+        """
+        Normalized copy with every field on a small fixed set: enums (unknown
+        values fall back to a default) and at most MAX_INTERESTS known
+        interests, so cache keys and pregenerated buckets stay few
+        """
+        level = self.experience_level.strip().lower()
+        background = self.background.strip().lower()
+        background = BACKGROUND_ALIASES.get(background, background)
+        examples = self.preferred_examples.strip().lower()
+        examples = EXAMPLE_ALIASES.get(examples, examples)
+        interests = sorted({i.strip().lower() for i in self.interests} & INTERESTS)[:MAX_INTERESTS]
+        return UserProfile(
+            experience_level=level if level in EXPERIENCE_LEVELS else "intermediate",
+            background=background if background in BACKGROUNDS else "other",
+            interests=interests or list(DEFAULT_INTERESTS),
+            preferred_examples=examples if examples in EXAMPLE_LANGUAGES else "python"
+        )
+    
+    def bucket(self) -> str:
+        """Stable string for a canonical profile, used in cache keys"""
+        return "|".join([
+            self.experience_level,
+            self.background,
+            ",".join(self.interests),
+            self.preferred_examples
+        ])
+
+
+def personalization_key(content: str, user_profile: UserProfile) -> str:
+    """Cache key: content hash + canonical profile bucket + prompt version"""
+    content_hash = hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+    return f"{PROMPT_VERSION}:{content_hash}:{user_profile.canonical().bucket()}"
 
 
 class PersonalizationService:
     def __init__(self):
         settings = get_settings()
-        self.api_key = settings.gemini_api_key
-        logger.info(f"Gemini API key configured: {'Yes' if self.api_key else 'No'}")
-        
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        else:
-            self.model = None
-    
-    def personalize_content(self, content: str, user_profile: UserProfile) -> str:
-        """
-        Adapt content based on user's background and experience level.
-        """
+        self.llm = get_llm_client()
         
-        if not self.model:
-            raise ValueError("Gemini API key not configured in .env file")
+        self.cache = None
+        if settings.personalization_cache_enabled:
+            self.cache = PersonalizationCache(
+                max_items=settings.personalization_cache_items,
+                ttl_seconds=settings.personalization_cache_ttl_seconds
+            )
+            register_cache("personalization", self.cache.stats)
         
-        prompt = f"""You are an expert educator adapting robotics content for different learners.
+        # Concurrent identical requests share one model call
+        self.flights = SingleFlight("personalization") if settings.personalization_coalesce_requests else None
+    
+    def _build_prompt(self, content: str, user_profile: UserProfile) -> str:
+        return f"""You are an expert educator adapting robotics content for different learners.
         
 User Profile:
 - Experience Level: {user_profile.experience_level}
@@ -57,25 +116,56 @@ Content to adapt:
 {content}
 
 Provide an adapted version that maintains accuracy while matching the user's level."""
+    
+    def _raise_friendly_error(self, e: LLMError):
+        logger.error(f"Personalization error ({e.kind}): {e}")
+        raise ValueError(e.user_message) from e
+    
+    async def _generate_async(self, content: str, user_profile: UserProfile) -> str:
+        prompt = self._build_prompt(content, user_profile)
 
         try:
             logger.info(f"Personalizing content for {user_profile.experience_level} user")
-            response = self.model.generate_content(prompt)
-            personalized = response.text
+            personalized = await self.llm.generate_async(prompt, priority=PRIORITY_CONTENT)
             logger.info(f"Personalization successful")
             return personalized
             
-        except Exception as e:
-            error_str = str(e).lower()
-            logger.error(f"Personalization error: {type(e).__name__}: {str(e)}")
+        except LLMError as e:
+            self._raise_friendly_error(e)
+    
+    def personalize_content(self, content: str, user_profile: UserProfile) -> str:
+        """Blocking wrapper around personalize_content_async, for scripts"""
+        return asyncio.run(self.personalize_content_async(content, user_profile))
+    
+    async def personalize_content_async(self, content: str, user_profile: UserProfile) -> str:
+        """
+        Adapt content based on user's background and experience level.
+        Results are cached per (content hash, canonical profile), and
+        concurrent identical requests share one model call when coalescing is on.
+        """
+        
+        if not self.llm.configured:
+            raise ValueError("Gemini API key not configured in .env file")
+        
+        user_profile = user_profile.canonical()
+        key = personalization_key(content, user_profile)
+        with span("personalize", chars=len(content), profile=user_profile.bucket()) as trace_span:
+            if self.cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
             
-            # User-friendly error messages
-            if "429" in str(e) or "quota" in error_str or "rate" in error_str:
-                raise ValueError("⏳ Personalization service is busy. Please wait a moment and try again.")
-            elif "api key" in error_str or "authentication" in error_str:
-                raise ValueError("🔑 API configuration issue. Please contact the administrator.")
-            else:
-                raise ValueError("😅 Personalization temporarily unavailable. Please try again.")
+            if self.flights is None:
+                return await self._generate_and_store(key, content, user_profile)
+            if trace_span is not None:
+                trace_span.set(coalesced=key in self.flights)
+            return await self.flights.do(key, lambda: self._generate_and_store(key, content, user_profile))
+    
+    async def _generate_and_store(self, key: str, content: str, user_profile: UserProfile) -> str:
+        personalized = await self._generate_async(content, user_profile)
+        if self.cache:
+            self.cache.put(key, personalized)
+        return personalized
 
 
 # Singleton
@@ -0,0 +1,216 @@
+"""
+Prompt Builder - assembles the chat prompt within a token budget.
+The instructions and the question always go in. The selection gets up to
+half of the remaining budget, then the conversation history up to half of
+what is left; retrieved chunks fill the rest, best ranked first.
+
+Chunks are packed a sentence (or whole code block) at a time. Sentences
+already in the prompt are dropped. That covers the overlap the chunker
+carries between neighbouring chunks, and context that repeats the
+selection. Whatever does not fit is cut at a sentence boundary, never
+mid-sentence or mid code block.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+import re
+
+from services.chunker import FENCE_PATTERN, SENTENCE_END
+from services.tokens import count_tokens
+
+WORDS = re.compile(r"\w+")
+MIN_DEDUPE_CHARS = 20  # shorter units (headings, "Yes.") may legitimately repeat
+
+INTRO = """You are a helpful AI tutor for a Physical AI & Humanoid Robotics textbook.
+Answer the user's question based on the textbook content provided as context.
+Be clear, educational, and accurate. Use examples when helpful.
+
+"""
+OUTRO = "\n\nPlease provide a helpful, educational response."
+
+
+@dataclass
+class _Unit:
+    text: str
+    tokens: int
+    key: str  # normalized text, for spotting repeats
+    ends_paragraph: bool
+
+
+@dataclass
+class BuiltPrompt:
+    text: str
+    tokens: int
+    context_pieces: int = 0  # retrieved pieces that made it in, whole or cut
+    dropped_pieces: int = 0  # pieces left out for budget or as duplicates
+    truncated: list[str] = field(default_factory=list)  # sections cut to fit
+
+
+def _normalize(text: str) -> str:
+    return " ".join(WORDS.findall(text.lower()))
+
+
+def _blocks(text: str) -> Iterable[tuple[str, bool]]:
+    """(block, is_code) for paragraphs and whole fenced code blocks"""
+    buffer: list[str] = []
+    fence = None
+    for line in text.split("\n"):
+        if fence is not None:
+            buffer.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                yield "\n".join(buffer), True
+                buffer = []
+            continue
+        match = FENCE_PATTERN.match(line)
+        if match or not line.strip():
+            if buffer:
+                yield "\n".join(buffer), False
+                buffer = []
+            if match:
+                fence = match.group(1)
+                buffer.append(line)
+            continue
+        buffer.append(line)
+    if buffer:
+        yield "\n".join(buffer), fence is not None
+
+
+def _units(text: str) -> list[_Unit]:
+    units = []
+    for block, is_code in _blocks(text):
+        pieces = [block] if is_code else [s for s in SENTENCE_END.split(block.strip()) if s]
+        for i, piece in enumerate(pieces):
+            units.append(_Unit(piece, count_tokens(piece), _normalize(piece), i == len(pieces) - 1))
+    return units
+
+
+def _join(units: list[_Unit]) -> str:
+    parts = []
+    for i, unit in enumerate(units):
+        parts.append(unit.text)
+        if i < len(units) - 1:
+            parts.append("\n\n" if unit.ends_paragraph else " ")
+    return "".join(parts)
+
+
+def truncate(text: str, max_tokens: int, keep: str = "head") -> tuple[str, bool]:
+    """
+    `text` cut to at most `max_tokens` on sentence boundaries, keeping the
+    start ("head") or the end ("tail"). Returns (text, whether it was cut).
+    """
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    units = _units(text)
+    if keep == "tail":
+        units.reverse()
+    kept, used = [], 0
+    for unit in units:
+        if used + unit.tokens > max_tokens:
+            break
+        kept.append(unit)
+        used += unit.tokens
+    if not kept and units:
+        # A single sentence longer than the budget: fall back to whole words
+        return _cut_words(units[0].text, max_tokens, keep), True
+    if keep == "tail":
+        kept.reverse()
+    return _join(kept), True
+
+
+def _cut_words(text: str, max_tokens: int, keep: str) -> str:
+    words = text.split()
+    count = max(0, int(len(words) * max_tokens / max(1, count_tokens(text))) - 1)
+    if not count:
+        return ""
+    return " ".join(words[:count]) + " ..." if keep == "head" else "... " + " ".join(words[-count:])
+
+
+class PromptBuilder:
+    def __init__(self, max_tokens: int = 3000, min_piece_tokens: int = 50):
+        """`min_piece_tokens`: a chunk is not worth cutting down to fewer tokens than this"""
+        self.max_tokens = max_tokens
+        self.min_piece_tokens = min_piece_tokens
+
+    def _pack(self, pieces: list[str], budget: int, seen: set[str], selection_key: str) -> tuple[list[str], int, int]:
+        """Fit de-duplicated pieces into `budget`; returns (texts, tokens used, pieces dropped)"""
+        packed, used, dropped = [], 0, 0
+        for piece in pieces:
+            units = []
+            for unit in _units(piece):
+                repeated = len(unit.key) >= MIN_DEDUPE_CHARS and (
+                    unit.key in seen or unit.key in selection_key
+                )
+                if not repeated:
+                    units.append(unit)
+            if not units:
+                dropped += 1
+                continue
+
+            tokens = sum(unit.tokens for unit in units)
+            room = budget - used
+            if tokens > room:
+                if room < self.min_piece_tokens:
+                    dropped += 1
+                    continue  # a shorter, lower ranked piece may still fit
+                kept, kept_tokens = [], 0
+                for unit in units:
+                    if kept_tokens + unit.tokens > room:
+                        break
+                    kept.append(unit)
+                    kept_tokens += unit.tokens
+                units, tokens = kept, kept_tokens
+                if not units:
+                    dropped += 1
+                    continue
+
+            seen.update(unit.key for unit in units)
+            packed.append(_join(units))
+            used += tokens
+        return packed, used, dropped
+
+    def build(
+        self,
+        query: str,
+        context: Iterable[str] = (),
+        selected_text: Optional[str] = None,
+        history: str = ""
+    ) -> BuiltPrompt:
+        """`context` pieces are retrieved chunks, best first (or a given context as one piece)"""
+        question = f"Question: {query}"
+        fixed = INTRO + question + OUTRO
+        remaining = max(0, self.max_tokens - count_tokens(fixed))
+        truncated = []
+
+        selection_section = ""
+        seen: set[str] = set()
+        selection_key = ""
+        if selected_text:
+            selected, cut = truncate(selected_text, remaining // 2)
+            if cut:
+                truncated.append("selection")
+            selection_section = f'The user has selected this text:\n"{selected}"\n\n'
+            remaining -= count_tokens(selection_section)
+            selection_key = _normalize(selected)
+            seen.update(unit.key for unit in _units(selected))
+
+        history_section = ""
+        if history:
+            # The most recent turns matter most, so cut from the front
+            kept, cut = truncate(history, remaining // 2, keep="tail")
+            if cut:
+                truncated.append("history")
+            if kept:
+                history_section = f"Conversation so far:\n{kept}\n\n"
+                remaining -= count_tokens(history_section)
+
+        pieces = [piece for piece in context if piece and piece.strip()]
+        packed, _, dropped = self._pack(pieces, max(0, remaining), seen, selection_key)
+        if dropped:
+            truncated.append("context")
+        context_section = ""
+        if packed or not selected_text:
+            context_section = "Context from the textbook:\n" + "\n\n".join(packed) + "\n\n"
+
+        text = INTRO + context_section + history_section + selection_section + question + OUTRO
+        return BuiltPrompt(text, count_tokens(text), len(packed), dropped, truncated)
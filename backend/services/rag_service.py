@@ -3,10 +3,26 @@ RAG Service - The brain of my chatbot.
 Now uses Google Gemini for chat (FREE tier) while keeping Qdrant for vector storage.
 """
 
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, Iterable, Optional
+import asyncio
 import hashlib
-import google.generativeai as genai
-from config import get_settings
+import threading
+from config import data_path, get_settings
+from services.search_index import BM25Index
+from services.chunker import Chunk, chunk_markdown
+from services.llm_client import LLMError, get_llm_client
+from services.embeddings import create_embedder
+from services.vector_store import InMemoryVectorStore, create_vector_store
+from services.hybrid_search import HybridConfig, HybridSearcher
+from services.chunk_store import open_snapshot, save_snapshot
+from services.metadata_index import MetadataIndex, Scope
+from services.selection_index import SelectionIndex
+from services.conversation_store import get_conversation_store
+from services.answer_cache import AnswerCache
+from services.prompt_builder import PromptBuilder
+from services.metrics import STAGE_SECONDS, register_cache
+from services.tracing import current_span, finish_span, iterate_in_span, span, start_span
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -16,25 +32,209 @@ logger = logging.getLogger(__name__)
 class RAGService:
     def __init__(self):
         settings = get_settings()
+        self.chunk_max_tokens = settings.chunk_max_tokens
+        self.chunk_overlap_tokens = settings.chunk_overlap_tokens
+        self.search_mode = settings.search_mode
+        self.selection_context_mode = settings.selection_context
+        self.selection_neighbors = settings.selection_neighbors
         
-        # Initialize Gemini for chat
-        self.gemini_api_key = settings.gemini_api_key
-        if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            logger.info("Gemini API configured for RAG chat")
-        else:
-            self.model = None
-            logger.warning("Gemini API key not configured")
+        # Shared Gemini client (model, concurrency limit, timeouts, error mapping)
+        self.llm = get_llm_client()
+        
+        # In-memory chunk store keyed by chunk id, plus a BM25 inverted index
+        # over the same ids. In production, you'd use Qdrant with OpenAI embeddings
+        self.context_store: dict[int, dict] = {}
+        self.index = BM25Index()
+        self._next_chunk_id = 0
+        
+        # Chapter/source -> chunk id bitmaps, for scoped queries
+        self.metadata = MetadataIndex()
+        
+        # Shingle index for locating highlighted text; built on first use
+        self.selection: Optional[SelectionIndex] = None
+        
+        # Chat prompts are packed into a fixed token budget
+        self.prompts = PromptBuilder(settings.prompt_max_tokens, settings.prompt_min_piece_tokens)
+        
+        # Per-conversation history (recent turns + running summary)
+        self.conversations = get_conversation_store() if settings.conversation_memory_enabled else None
+        
+        # Answers to stand-alone questions, reused for repeats and near-duplicates
+        self.answers = None
+        if settings.answer_cache_enabled:
+            self.answers = AnswerCache(
+                settings.answer_cache_items,
+                settings.answer_cache_similarity,
+                settings.answer_cache_min_overlap
+            )
+            register_cache("answer", self.answers.stats)
+        
+        # Dense vectors are only built when a mode that uses them is configured
+        self.embedder = None
+        self.vectors = None
+        self.hybrid = None
+        if self.search_mode != "bm25":
+            self.embedder = create_embedder()
+            self.vectors = create_vector_store(self.embedder.dimension)
+            self.hybrid = HybridSearcher(
+                self.index, self.vectors, self.embedder, self.context_store,
+                HybridConfig(
+                    candidates=settings.hybrid_candidates,
+                    lexical_budget_ms=settings.hybrid_lexical_budget_ms,
+                    vector_budget_ms=settings.hybrid_vector_budget_ms,
+                    rerank=settings.rerank_enabled,
+                    rerank_budget_ms=settings.rerank_budget_ms,
+                    min_score_ratio=settings.rerank_min_score_ratio
+                )
+            )
+            logger.info(
+                f"Vector search enabled with the {self.embedder.name} embedder "
+                f"and the {self.vectors.name} vector store"
+            )
+        
+        # Manifest of ingested documents: source -> content hash and chunk ids,
+        # so a changed document replaces exactly its own chunks
+        self.sources: dict[str, dict] = {}
+        self._lock = threading.RLock()
         
-        # For now, we'll use a simple in-memory context store
-        # In production, you'd use Qdrant with OpenAI embeddings
-        self.context_store = []
-        self._load_sample_context()
+        # Persisted index: map the last snapshot instead of rebuilding
+        self.snapshot_dir = data_path("index") if settings.index_persist else None
+        self.save_delay_seconds = settings.index_save_delay_seconds
+        self._save_timer: Optional[threading.Timer] = None
+        # Serializes snapshot writes, which run outside self._lock
+        self._save_lock = threading.Lock()
+        self._mapped = False
+        if not self._load_snapshot():
+            # A fresh index reuses chunk ids from 0, so vectors a persistent
+            # store (Qdrant) kept from an earlier index would point at the
+            # wrong chunks
+            if self.vectors is not None and len(self.vectors):
+                logger.info(f"Clearing {len(self.vectors)} stale vectors from the {self.vectors.name} store")
+                self.vectors.clear()
+            self._load_sample_context()
+    
+    def _bind_indexes(self, chunks, index, vectors, metadata):
+        """Point the service (and the hybrid searcher) at a set of indexes"""
+        self.context_store = chunks
+        self.index = index
+        self.vectors = vectors
+        self.metadata = metadata
+        if self.hybrid is not None:
+            self.hybrid.texts = chunks
+            self.hybrid.index = index
+            self.hybrid.vectors = vectors
+    
+    def _load_snapshot(self) -> bool:
+        """Serve straight from a memory-mapped snapshot if a compatible one exists"""
+        if self.snapshot_dir is None:
+            return False
+        snapshot = open_snapshot(self.snapshot_dir)
+        if snapshot is None:
+            return False
+        
+        manifest = snapshot.manifest
+        vectors = self.vectors
+        if self.embedder is not None:
+            if manifest.get("embedder") != self.embedder.name:
+                logger.warning("Index snapshot was built with a different embedder; re-ingest to rebuild it")
+                return False
+            if isinstance(self.vectors, InMemoryVectorStore):
+                if snapshot.vectors is None or snapshot.vectors.dimension != self.embedder.dimension:
+                    logger.warning("Index snapshot has no usable embeddings; re-ingest to rebuild it")
+                    return False
+                vectors = InMemoryVectorStore(self.embedder.dimension, index=snapshot.vectors)
+        
+        self._bind_indexes(snapshot.chunks, snapshot.bm25, vectors, snapshot.metadata)
+        self.sources = manifest["sources"]
+        self._next_chunk_id = manifest["next_chunk_id"]
+        self._mapped = True
+        return True
+    
+    def _ensure_mutable(self):
+        """
+        Copy a mapped snapshot into the in-memory structures before the
+        first change. Queries on a freshly started server never pay for this.
+        """
+        if not self._mapped:
+            return
+        chunks = dict(self.context_store.items())
+        index = self.index.to_index()
+        if self.vectors is not None:
+            self.vectors.make_mutable()
+        self._bind_indexes(chunks, index, self.vectors, self.metadata)
+        self._mapped = False
+    
+    def schedule_save(self):
+        """
+        Snapshot after `save_delay_seconds`, so a burst of single-document
+        ingests writes the index once rather than once per document
+        """
+        if self.snapshot_dir is None:
+            return
+        if self.save_delay_seconds <= 0:
+            self.save_index()
+            return
+        with self._lock:
+            if self._save_timer is None:
+                # Not a daemon thread: a pending snapshot is still written at exit
+                self._save_timer = threading.Timer(self.save_delay_seconds, self.save_index)
+                self._save_timer.start()
+    
+    def save_index(self):
+        """Write the current store to disk as a snapshot (no-op if persistence is off)"""
+        if self.snapshot_dir is None:
+            return
+        # Copy the store under the lock, then write with searches and ingests
+        # running; _save_lock keeps concurrent saves from interleaving
+        with self._save_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if self._mapped:
+                    return
+                chunks = dict(self.context_store)
+                index = self.index.copy()
+                # Qdrant persists its own vectors
+                vectors = self.vectors.index.copy() if isinstance(self.vectors, InMemoryVectorStore) else None
+                manifest = {
+                    "sources": dict(self.sources),
+                    "next_chunk_id": self._next_chunk_id,
+                    "embedder": self.embedder.name if self.embedder else None
+                }
+                metadata = self.metadata.copy()
+            save_snapshot(self.snapshot_dir, chunks, index, vectors, manifest, metadata)
+    
+    def _add_chunk(self, text: str, source: str, **metadata) -> int:
+        """Store a chunk and index it once, so queries never re-read the text"""
+        chunk_id = self._next_chunk_id
+        self._next_chunk_id += 1
+        self.context_store[chunk_id] = {"text": text, "source": source, **metadata}
+        self.index.add(chunk_id, text)
+        self.metadata.add(chunk_id, self.context_store[chunk_id])
+        if self.selection is not None:
+            self.selection.add(chunk_id, text)
+        return chunk_id
+    
+    def _add_vectors(self, chunk_ids: list[int], vectors):
+        """Batch-upsert the embeddings of freshly added chunks"""
+        if vectors is None:
+            return
+        payloads = [
+            {"source": self.context_store[i]["source"], "chapter": self.context_store[i].get("chapter")}
+            for i in chunk_ids
+        ]
+        self.vectors.add(chunk_ids, vectors, payloads)
+    
+    def _embed(self, texts: list[str]):
+        """Embed a batch of chunk texts, or None when vector search is off"""
+        if self.embedder is None or not texts:
+            return None
+        return self.embedder.embed(texts)
     
     def _load_sample_context(self):
         """Load sample context about the textbook for demo purposes"""
-        self.context_store = [
+        samples = [
             {
                 "text": "Physical AI combines artificial intelligence with physical systems like robots. It enables machines to perceive, understand, and interact with the real world.",
                 "source": "Chapter 1 - Introduction"
@@ -64,79 +264,418 @@ class RAGService:
                 "source": "Chapter 5 - AI Algorithms"
             }
         ]
+        chunk_ids = [self._add_chunk(sample["text"], sample["source"]) for sample in samples]
+        self._add_vectors(chunk_ids, self._embed([sample["text"] for sample in samples]))
+    
+    def chunk_document(self, content) -> Iterable[Chunk]:
+        """Chunk a document with the configured token budget"""
+        return chunk_markdown(
+            content,
+            max_tokens=self.chunk_max_tokens,
+            overlap_tokens=self.chunk_overlap_tokens
+        )
+    
+    def ingest_document(self, content, metadata: dict) -> int:
+        """
+        Chunk a Markdown/MDX document and add the chunks to the index.
+        `content` can be a string or an open file; it is streamed through the
+        chunker so no intermediate copy of the whole document is built.
+        Re-ingesting the same source replaces its previous chunks.
+        """
+        hasher = hashlib.sha256()
+        if isinstance(content, str):
+            hasher.update(content.encode("utf-8"))
+        else:
+            content = _hashing_lines(content, hasher)
+        
+        chunks = list(self.chunk_document(content))
+        count = self.replace_source(metadata, chunks, hasher.hexdigest())
+        self.schedule_save()
+        return count
+    
+    def source_hash(self, source: str) -> Optional[str]:
+        """Content hash recorded for a source at its last ingest"""
+        record = self.sources.get(source)
+        return record["hash"] if record else None
+    
+    def replace_source(
+        self,
+        metadata: dict,
+        chunks: list[Chunk],
+        content_hash: str,
+        origin: Optional[str] = None
+    ) -> int:
+        """
+        Swap the chunks of one source for a freshly chunked version.
+        `origin` records which batch (e.g. a docs root) the source came from.
+        """
+        metadata = dict(metadata)
+        source = metadata.pop("source", "unknown")
+        
+        # Embedding can be slow (or remote), so do it before taking the lock
+        vectors = self._embed([chunk.text for chunk in chunks])
+        
+        with self._lock:
+            self._ensure_mutable()
+            self.remove_source(source)
+            chunk_ids = [
+                self._add_chunk(chunk.text, source, heading=chunk.heading, **metadata)
+                for chunk in chunks
+            ]
+            self._add_vectors(chunk_ids, vectors)
+            self.sources[source] = {
+                "hash": content_hash,
+                "chunk_ids": chunk_ids,
+                "origin": origin
+            }
+        
+        logger.info(f"Ingested {len(chunk_ids)} chunks from {source}")
+        return len(chunk_ids)
+    
+    def remove_source(self, source: str) -> int:
+        """Drop every chunk that came from `source`"""
+        with self._lock:
+            self._ensure_mutable()
+            record = self.sources.pop(source, None)
+            if not record:
+                return 0
+            for chunk_id in record["chunk_ids"]:
+                chunk = self.context_store.pop(chunk_id, None)
+                if chunk is not None:
+                    self.metadata.remove(chunk_id, chunk)
+                    if self.selection is not None:
+                        self.selection.remove(chunk_id, chunk["text"])
+                self.index.remove(chunk_id)
+            if self.vectors is not None:
+                self.vectors.remove_many(record["chunk_ids"])
+            if self.answers is not None:
+                self.answers.invalidate(record["chunk_ids"])
+            return len(record["chunk_ids"])
+    
+    def _search_ids(self, query: str, limit: int, mode: str, scope: Optional[Scope]) -> list[tuple[int, float]]:
+        if mode in ("vector", "hybrid") and self.vectors is None:
+            raise ValueError(f"{mode} search needs embeddings (set SEARCH_MODE={mode})")
+        if mode == "hybrid":
+            return self.hybrid.search(query, limit, scope)
+        if mode == "vector":
+            return self.vectors.search(self.embedder.embed_one(query), limit, scope)
+        return self.index.search(query, limit, None if scope is None else scope.ids.tolist())
+    
+    def search(
+        self,
+        query: str,
+        limit: int = 3,
+        mode: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> list[dict]:
+        """
+        Search the chunk store. "bm25" uses the inverted index, so cost grows
+        with the postings of the query terms; "vector" is one matrix-vector
+        product over the normalized embedding matrix; "hybrid" fuses both and
+        reranks, and may return fewer than `limit` chunks when the tail is weak.
+        
+        `chapter` and `source` restrict the search to matching chunks; they are
+        resolved through the metadata index first, so only those chunks are scored.
+        """
+        return [result for _, result in self._search_with_ids(query, limit, mode, chapter, source)]
     
-    def search(self, query: str, limit: int = 3) -> list[dict]:
-        """Simple keyword-based search for demo. In production, use embeddings."""
-        query_lower = query.lower()
+    def _search_with_ids(
+        self,
+        query: str,
+        limit: int = 3,
+        mode: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> list[tuple[int, dict]]:
+        """search(), keeping the chunk id next to each result"""
+        mode = mode or self.search_mode
         results = []
+        with span("rag.search", mode=mode, limit=limit), STAGE_SECONDS.time("search"), self._lock:
+            scope = self.metadata.scope(chapter=chapter, source=source)
+            if scope is not None and not len(scope):
+                return []
+            for chunk_id, score in self._search_ids(query, limit, mode, scope):
+                chunk = self.context_store.get(chunk_id)
+                if chunk is None:
+                    # e.g. a stale point left in a shared Qdrant collection
+                    continue
+                results.append((chunk_id, {
+                    "text": chunk["text"],
+                    "source": chunk["source"],
+                    "score": round(score, 4)
+                }))
+        return results
+    
+    def _selection_index(self) -> SelectionIndex:
+        with self._lock:
+            if self.selection is None:
+                self.selection = SelectionIndex.build(self.context_store.items())
+            return self.selection
+    
+    def _neighborhood(self, chunk_id: int, radius: int) -> list[int]:
+        """`chunk_id` and up to `radius` chunks either side of it in its document"""
+        chunk = self.context_store.get(chunk_id)
+        record = self.sources.get(chunk["source"]) if chunk else None
+        if not record or chunk_id not in record["chunk_ids"]:
+            return [chunk_id]
+        position = record["chunk_ids"].index(chunk_id)
+        return record["chunk_ids"][max(0, position - radius):position + radius + 1]
+    
+    def selection_context(self, selected_text: str) -> tuple[str, list[dict]]:
+        """
+        Context and sources for a question about highlighted text.
+        In "selection" mode that is just the selection. In "neighborhood" mode
+        the selection is located in the chunk store and the chunks around it
+        are used, so the answer sees what comes before and after; a selection
+        that can't be located falls back to the selection alone.
+        """
+        selected_source = {"text": selected_text[:200], "source": "selected", "score": 1.0}
+        if self.selection_context_mode != "neighborhood":
+            return selected_text, [selected_source]
+        
+        with span("rag.selection"), self._lock:
+            located = self._selection_index().locate(selected_text)[:2]
+            if not located:
+                return selected_text, [selected_source]
+            
+            scores = dict(located)
+            chunk_ids: list[int] = []
+            for chunk_id, _ in located:
+                for neighbor in self._neighborhood(chunk_id, self.selection_neighbors):
+                    if neighbor not in chunk_ids:
+                        chunk_ids.append(neighbor)
+            # Context in reading order; sources with the located chunks first
+            chunk_ids.sort()
+            chunks = [(chunk_id, self.context_store[chunk_id]) for chunk_id in chunk_ids]
         
-        for item in self.context_store:
-            text_lower = item["text"].lower()
-            # Simple relevance scoring
-            score = sum(1 for word in query_lower.split() if word in text_lower)
-            if score > 0:
-                results.append({
-                    "text": item["text"],
-                    "source": item["source"],
-                    "score": score
-                })
-        
-        # Sort by score and return top results
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:limit]
+        context = "\n\n".join(chunk["text"] for _, chunk in chunks)
+        sources = sorted(
+            (
+                {"text": chunk["text"], "source": chunk["source"], "score": round(scores.get(chunk_id, 0.0), 4)}
+                for chunk_id, chunk in chunks
+            ),
+            key=lambda source: source["score"],
+            reverse=True
+        )
+        return context, sources
+    
+    def _build_prompt(
+        self,
+        query: str,
+        context: Optional[str] = None,
+        selected_text: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None,
+        history: str = ""
+    ) -> tuple[str, list[dict], list[int]]:
+        """
+        Search for context (unless given) and build the chat prompt.
+        Returns the prompt, the search results and their chunk ids.
+        """
+        
+        # Search for relevant context, within a chapter/page if one is given.
+        # Skipped entirely when the caller already supplies the context
+        search_results = []
+        chunk_ids = []
+        pieces = [context] if context is not None else []
+        if context is None:
+            hits = self._search_with_ids(query, chapter=chapter, source=source)
+            chunk_ids = [chunk_id for chunk_id, _ in hits]
+            search_results = [result for _, result in hits]
+            pieces = [r["text"] for r in search_results]
+        
+        # Packed into the token budget, without repeating the selection or
+        # the overlap between neighbouring chunks
+        with span("rag.prompt") as trace_span, STAGE_SECONDS.time("prompt"):
+            built = self.prompts.build(query, pieces, selected_text, history)
+        if trace_span is not None:
+            trace_span.set(tokens=built.tokens, pieces=built.context_pieces, dropped=built.dropped_pieces)
+        if built.truncated:
+            logger.info(f"Prompt trimmed to {built.tokens} tokens (cut: {', '.join(built.truncated)})")
+        prompt = built.text
+        return prompt, search_results, chunk_ids
+    
+    def _cached_answer(
+        self,
+        query: str,
+        chunk_ids: list[int],
+        context: Optional[str],
+        selected_text: Optional[str],
+        history: str
+    ) -> Optional[str]:
+        """
+        A cached answer, if this is a stand-alone question (no given context,
+        selection or conversation history) that was answered before
+        """
+        if self.answers is None or context is not None or selected_text or history:
+            return None
+        cached = self.answers.get(query, chunk_ids)
+        return cached.answer if cached else None
+    
+    def _cache_answer(
+        self,
+        query: str,
+        chunk_ids: list[int],
+        answer: str,
+        context: Optional[str],
+        selected_text: Optional[str],
+        history: str
+    ):
+        if self.answers is None or context is not None or selected_text or history:
+            return
+        if answer and chunk_ids:
+            self.answers.put(query, chunk_ids, answer)
+    
+    def _history(self, conversation_id: Optional[str]) -> str:
+        if not conversation_id or self.conversations is None:
+            return ""
+        return self.conversations.history(conversation_id)
+    
+    def _remember(self, conversation_id: Optional[str], query: str, answer: str):
+        """Record a successful exchange; failed calls never enter the history"""
+        if conversation_id and self.conversations is not None:
+            self.conversations.append(conversation_id, query, answer)
+    
+    def _error_message(self, e: LLMError) -> str:
+        logger.error(f"Gemini error ({e.kind}): {e}")
+        return e.user_message
     
     def generate_response(
         self, 
         query: str, 
         context: Optional[str] = None,
-        selected_text: Optional[str] = None
+        selected_text: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None,
+        conversation_id: Optional[str] = None
+    ) -> tuple[str, list[dict]]:
+        """
+        Generate a response using Gemini with RAG context. A blocking wrapper
+        around generate_response_async for scripts; not for use on a running loop.
+        """
+        return asyncio.run(self.generate_response_async(
+            query, context, selected_text, chapter, source, conversation_id
+        ))
+    
+    async def generate_response_async(
+        self,
+        query: str,
+        context: Optional[str] = None,
+        selected_text: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None,
+        conversation_id: Optional[str] = None
     ) -> tuple[str, list[dict]]:
-        """Generate a response using Gemini with RAG context"""
+        """Search, build the prompt and await Gemini on the shared LLM client"""
         
-        if not self.model:
+        if not self.llm.configured:
             return "Please configure the Gemini API key in backend/.env", []
         
-        # Search for relevant context
-        search_results = self.search(query)
+        with span("rag.generate") as trace_span:
+            history = await asyncio.to_thread(self._history, conversation_id)
+            # Retrieval blocks (stage budgets, embedding), so keep it off the loop
+            prompt, search_results, chunk_ids = await asyncio.to_thread(
+                self._build_prompt, query, context, selected_text, chapter, source, history
+            )
+            
+            # Repeated questions skip the model round trip entirely
+            answer = self._cached_answer(query, chunk_ids, context, selected_text, history)
+            if trace_span is not None:
+                trace_span.set(cached=answer is not None, history=bool(history))
+            if answer is None:
+                try:
+                    answer = await self.llm.generate_async(prompt)
+                except LLMError as e:
+                    return self._error_message(e), []
+                self._cache_answer(query, chunk_ids, answer, context, selected_text, history)
+            await asyncio.to_thread(self._remember, conversation_id, query, answer)
+            return answer, search_results
+    
+    async def stream_response(
+        self,
+        query: str,
+        context: Optional[str] = None,
+        selected_text: Optional[str] = None,
+        chapter: Optional[str] = None,
+        source: Optional[str] = None,
+        conversation_id: Optional[str] = None
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Streaming variant of generate_response. Yields (event, payload) pairs:
+        one "sources" event up front, then a "token" event per model chunk,
+        and finally "done" (or "error" with a user-friendly message).
+        """
         
-        if context is None:
-            context = "\n\n".join([r["text"] for r in search_results])
+        # The span stays open across yields, so it is started and finished by
+        # hand; the events are produced with it current, so search and model
+        # spans nest under it like in generate_response_async
+        trace_span = start_span("rag.generate", streamed=True)
+        error = None
+        try:
+            events = self._stream_events(query, context, selected_text, chapter, source, conversation_id)
+            async with aclosing(iterate_in_span(trace_span, events)) as stepped:
+                async for event in stepped:
+                    yield event
+        except GeneratorExit:
+            # Client went away; not an error
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            finish_span(trace_span, error)
+    
+    async def _stream_events(
+        self,
+        query: str,
+        context: Optional[str],
+        selected_text: Optional[str],
+        chapter: Optional[str],
+        source: Optional[str],
+        conversation_id: Optional[str]
+    ) -> AsyncIterator[tuple[str, dict]]:
+        if not self.llm.configured:
+            yield "error", {"message": "Please configure the Gemini API key in backend/.env"}
+            return
         
-        # Build prompt
-        prompt = f"""You are a helpful AI tutor for a Physical AI & Humanoid Robotics textbook.
-Answer the user's question based on the textbook content provided as context.
-Be clear, educational, and accurate. Use examples when helpful.
-
-Context from the textbook:
-{context}
-
-"""
-        if selected_text:
-            prompt += f"""The user has selected this text:
-"{selected_text}"
-
-"""
+        history = await asyncio.to_thread(self._history, conversation_id)
+        prompt, search_results, chunk_ids = await asyncio.to_thread(
+            self._build_prompt, query, context, selected_text, chapter, source, history
+        )
+        yield "sources", {"sources": search_results}
+        
+        cached = self._cached_answer(query, chunk_ids, context, selected_text, history)
+        trace_span = current_span()
+        if trace_span is not None:
+            trace_span.set(cached=cached is not None, history=bool(history))
+        if cached is not None:
+            # Sent as one token event; the client renders it the same way
+            yield "token", {"text": cached}
+            await asyncio.to_thread(self._remember, conversation_id, query, cached)
+            yield "done", {}
+            return
         
-        prompt += f"""Question: {query}
+        pieces = []
+        try:
+            async for text in self.llm.stream_async(prompt):
+                pieces.append(text)
+                yield "token", {"text": text}
+        except LLMError as e:
+            yield "error", {"message": self._error_message(e)}
+            return
+        
+        answer = "".join(pieces)
+        self._cache_answer(query, chunk_ids, answer, context, selected_text, history)
+        await asyncio.to_thread(self._remember, conversation_id, query, answer)
+        yield "done", {}
 
-Please provide a helpful, educational response."""
 
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text, search_results
-        except Exception as e:
-            error_str = str(e).lower()
-            logger.error(f"Gemini error: {e}")
-            
-            # User-friendly error messages
-            if "429" in str(e) or "quota" in error_str or "rate" in error_str:
-                return "⏳ I'm receiving too many requests right now. Please wait a moment and try again.", []
-            elif "api key" in error_str or "authentication" in error_str:
-                return "🔑 API configuration issue. Please contact the administrator.", []
-            elif "timeout" in error_str:
-                return "⏱️ The request timed out. Please try again.", []
-            else:
-                return "😅 Sorry, I encountered an issue. Please try again in a moment.", []
+def _hashing_lines(lines: Iterable[str], hasher) -> Iterable[str]:
+    """Pass lines through unchanged while feeding them to a hash"""
+    for line in lines:
+        hasher.update(line.encode("utf-8"))
+        yield line
 
 
 # Singleton instance
@@ -0,0 +1,199 @@
+"""
+Rate Limiter - keeps Gemini calls under the requests/min and tokens/min quota.
+Two token buckets (requests and tokens) refill continuously; a call waits
+until both can cover it, and waiting calls are served strictly by priority,
+so an interactive chat question never queues behind a chapter translation.
+A 429 halves the refill rate and each success wins a little of it back,
+which settles throughput just under the real quota instead of bouncing
+off it.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_CHAT = 0
+PRIORITY_CONTENT = 1  # translation and personalization
+
+MIN_RATE_SCALE = 0.25
+RECOVERY_STEP = 0.05
+POLL_SECONDS = 0.05
+
+
+class QueueTimeout(Exception):
+    """A call waited longer than its deadline for quota"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float):
+        self.per_minute = per_minute
+        self.capacity = max(1.0, capacity)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float, scale: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute * scale / 60)
+        self._updated = now
+
+    def wait_for(self, amount: float, scale: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)"""
+        # Requests larger than the bucket only need a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / (self.per_minute * scale))
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    tokens: float = field(compare=False)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float = 0,
+        burst_seconds: float = 10
+    ):
+        """A zero rate disables that bucket; `burst_seconds` of quota may be spent at once"""
+        self.requests = None
+        self.tokens = None
+        if requests_per_minute > 0:
+            self.requests = TokenBucket(requests_per_minute, requests_per_minute * burst_seconds / 60)
+        if tokens_per_minute > 0:
+            self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute * burst_seconds / 60)
+        self.rate_scale = 1.0
+        self._paused_until = 0.0
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.queued = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def _try_take(self, ticket: _Ticket) -> float:
+        """Take quota for `ticket` if it is first in line; otherwise how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            for bucket in self._buckets():
+                bucket.refill(now, self.rate_scale)
+            wait = max(
+                self.requests.wait_for(1, self.rate_scale) if self.requests else 0.0,
+                self.tokens.wait_for(ticket.tokens, self.rate_scale) if self.tokens else 0.0
+            )
+            if self._waiting[0] is not ticket:
+                # Behind someone; check back in case a higher priority call leaves
+                return max(wait, POLL_SECONDS)
+            if wait > 0:
+                return wait
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(ticket.tokens)
+            heapq.heappop(self._waiting)
+            return 0.0
+
+    def _enqueue(self, tokens: float, priority: int) -> _Ticket:
+        ticket = _Ticket(priority, next(self._seq), tokens)
+        with self._lock:
+            if self._waiting:
+                self.queued += 1
+            heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _abandon(self, ticket: _Ticket):
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+
+    async def acquire(self, tokens: float = 0, priority: int = PRIORITY_CHAT, timeout: Optional[float] = None):
+        """Wait for quota; raises QueueTimeout after `timeout` seconds"""
+        if not self.enabled:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = self._enqueue(tokens, priority)
+        try:
+            while True:
+                wait = self._try_take(ticket)
+                if wait == 0:
+                    return
+                if deadline is not None and time.monotonic() + min(wait, POLL_SECONDS) > deadline:
+                    raise QueueTimeout(f"no quota within {timeout}s")
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            self._abandon(ticket)
+
+    def acquire_blocking(self, tokens: float = 0, priority: int = PRIORITY_CHAT, timeout: Optional[float] = None):
+        """acquire() for synchronous callers"""
+        if not self.enabled:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = self._enqueue(tokens, priority)
+        try:
+            while True:
+                wait = self._try_take(ticket)
+                if wait == 0:
+                    return
+                if deadline is not None and time.monotonic() + min(wait, POLL_SECONDS) > deadline:
+                    raise QueueTimeout(f"no quota within {timeout}s")
+                time.sleep(min(wait, 1.0))
+        finally:
+            self._abandon(ticket)
+
+    def settle(self, estimated: float, actual: float):
+        """Correct the token bucket once a call's real size is known"""
+        if self.tokens is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+    def on_success(self):
+        with self._lock:
+            self.rate_scale = min(1.0, self.rate_scale + RECOVERY_STEP)
+
+    def on_rate_limited(self, backoff_seconds: float):
+        """The server said 429: slow down and hold everyone back for a moment"""
+        with self._lock:
+            self.throttled += 1
+            self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff_seconds)
+        logger.warning(
+            f"Gemini rate limited; pausing {backoff_seconds:.1f}s, "
+            f"rate now {self.rate_scale:.0%} of the configured quota"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "rate_scale": round(self.rate_scale, 3),
+            "waiting": len(self._waiting),
+            "queued": self.queued,
+            "throttled": self.throttled
+        }
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with jitter: between half and all of min(cap, base * 2^attempt)"""
+    ceiling = min(cap, base * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
@@ -0,0 +1,138 @@
+"""
+Search Index - BM25 keyword search over an inverted index.
+The index is built once at ingest time so a query only touches the
+postings of its own terms instead of scanning every stored chunk.
+"""
+
+from collections import Counter
+from typing import Collection, Iterable, Optional
+import heapq
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_][a-z0-9]+)*")
+
+# Common English words that would otherwise match almost every chunk
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it
+its me my not of on or so such than that the their then there these they this to
+was we what when where which while who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, split on non-alphanumerics and drop stopwords."""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring.
+
+    postings maps term -> {doc_id: term frequency}, and document lengths are
+    stored at insert time, so scoring a query is proportional to the number
+    of postings for its terms rather than the size of the corpus.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[int, int]] = {}
+        self.doc_lengths: dict[int, int] = {}
+        self.doc_terms: dict[int, tuple[str, ...]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def copy(self) -> "BM25Index":
+        """Independent copy, e.g. to snapshot without holding a lock"""
+        index = BM25Index(self.k1, self.b)
+        index.postings = {term: dict(docs) for term, docs in self.postings.items()}
+        index.doc_lengths = dict(self.doc_lengths)
+        index.doc_terms = dict(self.doc_terms)
+        index.total_length = self.total_length
+        return index
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Tokenize a document and add it to the postings."""
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = tuple(terms)
+        self.total_length += length
+
+        for term, freq in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = freq
+
+    def remove(self, doc_id: int) -> None:
+        """Drop a document from the index. Unknown ids are ignored."""
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+
+        # Only visit the terms this document actually contributed
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(
+        self,
+        query_terms: Iterable[str],
+        doc_ids: Optional[Collection[int]] = None
+    ) -> dict[int, float]:
+        """
+        Accumulate BM25 scores for every document that contains a query term.
+        With `doc_ids`, only those documents are scored, and each term walks
+        whichever is shorter: its postings or the allowed ids.
+        """
+        if not self.doc_lengths:
+            return {}
+        if doc_ids is not None and not isinstance(doc_ids, (set, frozenset)):
+            doc_ids = set(doc_ids)
+
+        avg_length = self.total_length / len(self.doc_lengths) or 1.0
+        k1, b = self.k1, self.b
+        doc_lengths = self.doc_lengths
+        scores: dict[int, float] = {}
+
+        for term in set(query_terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf(term)
+            if doc_ids is None:
+                matches = docs.items()
+            elif len(doc_ids) < len(docs):
+                matches = ((doc_id, docs[doc_id]) for doc_id in doc_ids if doc_id in docs)
+            else:
+                matches = ((doc_id, freq) for doc_id, freq in docs.items() if doc_id in doc_ids)
+            for doc_id, freq in matches:
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (k1 + 1) / (freq + norm)
+
+        return scores
+
+    def search(
+        self,
+        query: str,
+        limit: int = 3,
+        doc_ids: Optional[Collection[int]] = None
+    ) -> list[tuple[int, float]]:
+        """Return the top `limit` (doc_id, score) pairs, best first."""
+        scores = self.score(tokenize(query), doc_ids)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
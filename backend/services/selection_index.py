@@ -0,0 +1,63 @@
+"""
+Selection Index - finds which chunks a highlighted passage came from.
+Chunks are indexed by hashed word n-grams (shingles), so locating a
+selection is a handful of dict lookups rather than a search, and it still
+matches when the selection is rendered text rather than Markdown source.
+"""
+
+from typing import Iterable
+import re
+
+WORD_PATTERN = re.compile(r"\w+")
+SHINGLE_SIZE = 5
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    """Hashes of every run of `size` consecutive words, ignoring case and punctuation"""
+    words = WORD_PATTERN.findall(text.lower())
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+class SelectionIndex:
+    def __init__(self):
+        self._chunks: dict[int, list[int]] = {}  # shingle hash -> chunk ids
+
+    def add(self, chunk_id: int, text: str):
+        for shingle in shingles(text):
+            self._chunks.setdefault(shingle, []).append(chunk_id)
+
+    def remove(self, chunk_id: int, text: str):
+        for shingle in shingles(text):
+            chunk_ids = self._chunks.get(shingle)
+            if chunk_ids and chunk_id in chunk_ids:
+                chunk_ids.remove(chunk_id)
+                if not chunk_ids:
+                    del self._chunks[shingle]
+
+    def locate(self, text: str, min_coverage: float = 0.2) -> list[tuple[int, float]]:
+        """
+        Chunks containing the passage, as (chunk id, share of the passage's
+        shingles found in it), best first. A passage that spans a chunk
+        boundary returns both chunks. Passages shorter than one shingle
+        can't be located and return [].
+        """
+        query = shingles(text)
+        if not query:
+            return []
+        hits: dict[int, int] = {}
+        for shingle in query:
+            for chunk_id in self._chunks.get(shingle, ()):
+                hits[chunk_id] = hits.get(chunk_id, 0) + 1
+        located = [(chunk_id, count / len(query)) for chunk_id, count in hits.items()]
+        return sorted(
+            (item for item in located if item[1] >= min_coverage),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+    @classmethod
+    def build(cls, chunks: Iterable[tuple[int, dict]]) -> "SelectionIndex":
+        index = cls()
+        for chunk_id, chunk in chunks:
+            index.add(chunk_id, chunk["text"])
+        return index
@@ -0,0 +1,70 @@
+"""
+Single Flight - concurrent identical requests share one in-flight call.
+When a class opens the same chapter and hits Translate or Personalize
+within seconds, the first request (the leader) starts the model call and
+every duplicate that arrives before it finishes awaits the same task, so
+upstream calls scale with distinct requests rather than with users.
+
+Keys are canonical request hashes (the same keys the caches use). A
+failure reaches every waiter and is not remembered: the next request
+starts a fresh call. A waiter that is cancelled (client disconnected)
+just stops waiting; the shared call runs on for the others and for the
+cache it fills. Only if the shared call itself is cancelled do all
+waiters see CancelledError.
+
+Runs on the event loop; not for use from other threads.
+"""
+
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import logging
+
+from services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total", "Requests through a single-flight group, by role", ("flight", "role")
+)
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, create: Callable[[], Awaitable[T]]) -> T:
+        """Await `create()`, or the call already running for `key`"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            SINGLE_FLIGHT_CALLS.inc(self.name, "coalesced")
+        else:
+            self.leaders += 1
+            SINGLE_FLIGHT_CALLS.inc(self.name, "leader")
+            task = asyncio.ensure_future(create())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        # shield: one waiter going away must not cancel the call for the rest
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight)
+        }
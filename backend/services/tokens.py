@@ -0,0 +1,44 @@
+"""
+Token counting helpers shared by the chunker and prompt code.
+Uses tiktoken's cl100k_base encoding. If the encoding files can't be
+downloaded (e.g. an offline container), falls back to a word/punctuation
+count, which tracks BPE counts closely enough for sizing chunks.
+"""
+
+from functools import lru_cache
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "cl100k_base"
+_FALLBACK_PATTERN = re.compile(r"\w+|[^\w\s]")
+_encoding_lock = threading.Lock()
+
+
+@lru_cache()
+def _get_encoding():
+    # The ingest worker pool can hit this from several threads at once
+    with _encoding_lock:
+        return _load_encoding()
+
+
+@lru_cache()
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({type(e).__name__}), using approximate token counts")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text`."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(_FALLBACK_PATTERN.findall(text))
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,359 @@
+"""
+Tracing - per-request span trees for finding out why one request was slow.
+The middleware samples a share of requests (or any request sent with a
+sampled W3C traceparent header) and opens a root span; code on the
+request's path adds child spans with `with span("rag.search"):`. Spans
+follow the request through awaits, tasks and asyncio.to_thread via a
+context variable; in an unsampled request span() does nothing.
+
+Finished traces go to an optional exporter (OTLP/JSON lines, to the
+console or a file, written on a background thread) and to a buffer of the
+slowest recent requests served at /debug/slow-requests.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional, TypeVar
+import heapq
+import itertools
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+from config import data_path, get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SERVICE_NAME = "rag-chatbot"
+
+
+@dataclass
+class Span:
+    name: str
+    trace: "Trace"
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    spans: list[Span] = field(default_factory=list)
+    root: Optional[Span] = None
+
+    def tree(self) -> dict:
+        """Nested {"name", "duration_ms", "attributes", "children"} from the root span"""
+        children: dict[Optional[str], list[Span]] = {}
+        for span_ in self.spans:
+            children.setdefault(span_.parent_id, []).append(span_)
+
+        def node(span_: Span) -> dict:
+            entry = {
+                "name": span_.name,
+                "start_offset_ms": round((span_.start_ns - self.root.start_ns) / 1e6, 3),
+                "duration_ms": round(span_.duration_ms, 3),
+                "attributes": span_.attributes,
+                "children": [node(child) for child in sorted(children.get(span_.span_id, []), key=lambda s: s.start_ns)]
+            }
+            if span_.error:
+                entry["error"] = span_.error
+            return entry
+
+        return node(self.root)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """
+    A child of the current span that the caller ends with finish_span(); it
+    does not become current. For spans that cannot wrap a with-block, such
+    as ones that stay open across an async generator's yields.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace, _new_id(64), parent.span_id, time.time_ns(), attributes=attributes)
+
+
+def finish_span(span_: Optional[Span], error: Optional[BaseException] = None):
+    if span_ is None:
+        return
+    span_.end_ns = time.time_ns()
+    if error is not None:
+        span_.error = f"{type(error).__name__}: {error}"
+    span_.trace.spans.append(span_)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Child span of the current one for the duration of the block (None if not sampled)"""
+    span_ = start_span(name, **attributes)
+    if span_ is None:
+        yield None
+        return
+    token = _current.set(span_)
+    error = None
+    try:
+        yield span_
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        finish_span(span_, error)
+
+
+async def iterate_in_span(span_: Optional[Span], iterator: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Step an async iterator with `span_` (from start_span) current, so spans
+    opened inside it become children. Unlike a with-block around the loop,
+    the span is never left current across this generator's own yields.
+    """
+    try:
+        while True:
+            token = _current.set(span_) if span_ is not None else None
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                if token is not None:
+                    _current.reset(token)
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """One trace as an OTLP/JSON ExportTraceServiceRequest"""
+    spans = []
+    for span_ in trace.spans:
+        entry = {
+            "traceId": trace.trace_id,
+            "spanId": span_.span_id,
+            "name": span_.name,
+            "kind": 2 if span_ is trace.root else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(span_.start_ns),
+            "endTimeUnixNano": str(span_.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span_.attributes.items()],
+            "status": {"code": 2, "message": span_.error} if span_.error else {"code": 1}
+        }
+        if span_.parent_id:
+            entry["parentSpanId"] = span_.parent_id
+        spans.append(entry)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}]
+    }]}
+
+
+class TraceExporter:
+    """Writes finished traces as OTLP/JSON lines on a background thread"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(target=self._write, name="trace-exporter", daemon=True).start()
+
+    def export(self, trace: Trace):
+        self._queue.put(trace)
+
+    def _write(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                self._stream.write(json.dumps(to_otlp(trace), ensure_ascii=False) + "\n")
+                self._stream.flush()
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+
+class SlowRequestLog:
+    """The `size` slowest traces finished within the last `window_seconds`"""
+
+    def __init__(self, size: int = 20, window_seconds: float = 900):
+        self.size = size
+        self.window_seconds = window_seconds
+        self._heap: list[tuple[float, int, float, Trace]] = []  # (duration, seq, finished_at, trace)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        fresh = [entry for entry in self._heap if entry[2] > now - self.window_seconds]
+        if len(fresh) != len(self._heap):
+            heapq.heapify(fresh)
+            self._heap = fresh
+
+    def offer(self, trace: Trace):
+        duration = trace.root.duration_ms
+        now = time.monotonic()
+        with self._lock:
+            if len(self._heap) >= self.size and duration <= self._heap[0][0]:
+                self._expire(now)
+                if len(self._heap) >= self.size:
+                    return
+            entry = (duration, next(self._seq), now, trace)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            else:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest(self) -> list[Trace]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return [entry[3] for entry in sorted(self._heap, reverse=True)]
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float = 0.05,
+        exporter: Optional[TraceExporter] = None,
+        slow_log: Optional[SlowRequestLog] = None,
+        trust_traceparent: bool = False
+    ):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.slow_log = slow_log or SlowRequestLog()
+        # Whether a traceparent's sampled flag decides sampling; only for
+        # headers set by a trusted proxy, or any client could force tracing
+        self.trust_traceparent = trust_traceparent
+        self.sampled = 0
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+        """Root span for a request, or None when the request is not sampled"""
+        trace_id, parent_id = None, None
+        match = TRACEPARENT.match(traceparent or "")
+        if match and self.trust_traceparent:
+            if not int(match.group(3), 16) & 1:
+                return None  # the caller decided not to sample
+        elif self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if match:
+            # Sampled requests join the caller's trace either way
+            trace_id, parent_id = match.group(1), match.group(2)
+
+        self.sampled += 1
+        trace = Trace(trace_id or _new_id(128))
+        root = Span(name, trace, _new_id(64), parent_id, time.time_ns(), attributes=attributes)
+        trace.root = root
+        return root
+
+    def end_trace(self, root: Span, error: Optional[BaseException] = None):
+        finish_span(root, error)
+        self.slow_log.offer(root.trace)
+        if self.exporter is not None:
+            self.exporter.export(root.trace)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        settings = get_settings()
+        exporter = None
+        if settings.trace_exporter == "console":
+            exporter = TraceExporter(sys.stdout)
+        elif settings.trace_exporter == "file":
+            exporter = TraceExporter(open(data_path(settings.trace_file), "a", encoding="utf-8"))
+        elif settings.trace_exporter:
+            raise ValueError(f"Unknown trace exporter: {settings.trace_exporter}")
+        _tracer = Tracer(
+            settings.trace_sample_rate,
+            exporter,
+            SlowRequestLog(settings.trace_slow_requests, settings.trace_slow_window_seconds),
+            trust_traceparent=settings.trace_trust_traceparent
+        )
+    return _tracer
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span; it ends when the response body does"""
+
+    def __init__(self, app):
+        self.app = app
+        self.tracer = get_tracer()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}", traceparent, **{"http.method": scope["method"]}
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", root.trace.trace_id.encode("ascii"))
+                ]
+            await send(message)
+
+        token = _current.set(root)
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+            self.tracer.end_trace(root, error)
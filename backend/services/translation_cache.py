@@ -0,0 +1,153 @@
+"""
+Translation Cache - content-addressed store for translated segments.
+Keys are hashes of the normalized source text plus target language and
+prompt version, so the same paragraph is only ever sent to Gemini once.
+A small in-memory LRU sits in front of a SQLite file that survives restarts.
+A request reads all its segments with one query and writes them back in
+one transaction; callers on the event loop run those in a thread.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Stays under SQLite's default limit on bound parameters per statement
+QUERY_BATCH = 500
+
+
+def normalize_segment(text: str) -> str:
+    """Canonical form used for hashing: unified newlines, no trailing spaces"""
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def segment_key(text: str, target_language: str, prompt_version: str) -> str:
+    payload = f"{prompt_version}\0{target_language}\0{normalize_segment(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    def __init__(self, db_path: Optional[Path], memory_items: int = 2048):
+        self.memory_items = memory_items
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path is not None:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """The cached subset of `keys`, from memory or a single query per batch"""
+        keys = list(dict.fromkeys(keys))
+        found: dict[str, str] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = value
+                else:
+                    missing.append(key)
+
+            if self._db is not None:
+                for start in range(0, len(missing), QUERY_BATCH):
+                    batch = missing[start:start + QUERY_BATCH]
+                    rows = self._db.execute(
+                        f"SELECT key, value FROM translations WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, value in rows:
+                        self._remember(key, value)
+                        found[key] = value
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def remember(self, key: str, value: str):
+        """Memory only; the durable write comes with put_many"""
+        with self._lock:
+            self._remember(key, value)
+
+    def put(self, key: str, value: str):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[tuple[str, str]]):
+        """Store translations; the SQLite writes share one transaction"""
+        items = list(items)
+        if not items:
+            return
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            if self._db is not None:
+                now = time.time()
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO translations (key, value, created_at) VALUES (?, ?, ?)",
+                        [(key, value, now) for key, value in items]
+                    )
+
+    def clear_memory(self):
+        """Drop the in-memory layer; translations on disk are kept"""
+        with self._lock:
+            self._memory.clear()
+
+    def clear(self):
+        """Forget every translation, in memory and on disk"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "memory_items": len(self._memory)
+        }
@@ -3,35 +3,73 @@ Translation Service - Handles Urdu translation for chapter content.
 Uses Google Gemini API for high-quality translations (FREE tier available).
 """
 
-import google.generativeai as genai
-from config import get_settings
+from config import data_path, get_settings
+from services.llm_client import LLMError, get_llm_client
+from services.rate_limiter import PRIORITY_CONTENT
+from services.translation_cache import TranslationCache, segment_key
+from services.markdown_segments import group_segments, split_segments
+from services.single_flight import SingleFlight
+from services.metrics import register_cache
+from services.tracing import span
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
 import logging
+import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TARGET_LANGUAGE = "urdu"
+
+# Bump when the prompt changes so cached translations from the old prompt are not reused
+PROMPT_VERSION = "2"
+
+# Stands in for a code/math/MDX block inside a unit sent to the model
+BLOCK_MARKER = "<<<BLOCK_{}>>>"
+MARKER_PATTERN = re.compile(r"[ \t]*<<<BLOCK_(\d+)>>>[ \t]*\n?")
+
+
+@dataclass
+class TranslationUnit:
+    """
+    Consecutive segments translated with one model call. `pieces` are the
+    segments' texts with each block replaced by a marker line; `prose` are
+    the indexes of the pieces that need translating.
+    """
+    index: int  # position in the assembled result
+    key: str
+    original: str
+    pieces: list[str]
+    prose: list[int]
+    blocks: list[str]
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pieces)
+
 
 class TranslationService:
     def __init__(self):
         settings = get_settings()
-        self.api_key = settings.gemini_api_key
-        logger.info(f"Gemini API key configured: {'Yes' if self.api_key else 'No'}")
+        self.llm = get_llm_client()
         
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        else:
-            self.model = None
-    
-    def translate_to_urdu(self, content: str, preserve_code: bool = True) -> str:
-        """
-        Translate content to Urdu while preserving code blocks and technical terms.
-        """
+        self.segment_max_tokens = settings.translation_segment_max_tokens
+        self.max_parallel = max(1, settings.translation_max_parallel)
         
-        if not self.model:
-            raise ValueError("Gemini API key not configured in .env file")
+        self.cache = None
+        if settings.translation_cache_enabled:
+            self.cache = TranslationCache(
+                data_path("translation_cache.sqlite3"),
+                memory_items=settings.translation_cache_memory_items
+            )
+            register_cache("translation", self.cache.stats)
         
-        prompt = f"""You are an expert translator specializing in technical and educational content.
+        # Concurrent requests for the same chapter share each segment's model call
+        self.flights = SingleFlight("translation") if settings.translation_coalesce_requests else None
+    
+    def _build_prompt(self, content: str) -> str:
+        return f"""You are an expert translator specializing in technical and educational content.
 Translate the following text from English to Urdu.
 
 Rules:
@@ -42,32 +80,220 @@ Rules:
 5. Maintain markdown formatting
 6. Keep any mermaid diagrams in English
 7. For mathematical equations, keep the math but translate surrounding text
+8. Copy every <<<BLOCK_n>>> marker line unchanged, on its own line and in the same place
 
 Text to translate:
 {content}"""
+    
+    def _raise_friendly_error(self, e: LLMError):
+        logger.error(f"Translation error ({e.kind}): {e}")
+        raise ValueError(e.user_message) from e
+    
+    def translate_chunk(self, text: str) -> str:
+        """Blocking wrapper around translate_chunk_async, for scripts"""
+        return asyncio.run(self.translate_chunk_async(text))
+    
+    async def translate_chunk_async(self, text: str) -> str:
+        """Translate a smaller chunk of text with a single Gemini call"""
+        
+        if not self.llm.configured:
+            raise ValueError("Gemini API key not configured in .env file")
+        
+        prompt = self._build_prompt(text)
 
         try:
-            logger.info(f"Translating content of length: {len(content)}")
-            response = self.model.generate_content(prompt)
-            translated = response.text
-            logger.info(f"Translation successful, output length: {len(translated)}")
-            return translated
-            
-        except Exception as e:
-            error_str = str(e).lower()
-            logger.error(f"Translation error: {type(e).__name__}: {str(e)}")
+            logger.info(f"Translating chunk of length: {len(text)}")
+            with span("translate.segment", chars=len(text)):
+                return await self.llm.generate_async(prompt, priority=PRIORITY_CONTENT)
             
-            # User-friendly error messages
-            if "429" in str(e) or "quota" in error_str or "rate" in error_str:
-                raise ValueError("⏳ Translation service is busy. Please wait a moment and try again.")
-            elif "api key" in error_str or "authentication" in error_str:
-                raise ValueError("🔑 API configuration issue. Please contact the administrator.")
+        except LLMError as e:
+            self._raise_friendly_error(e)
+    
+    def _unit(self, index: int, group: list) -> TranslationUnit:
+        pieces, prose, blocks = [], [], []
+        for segment in group:
+            if segment.translatable:
+                prose.append(len(pieces))
+                pieces.append(segment.text)
+            elif segment.text.strip():
+                newline = "\n" if segment.text.endswith("\n") else ""
+                pieces.append(BLOCK_MARKER.format(len(blocks)) + newline)
+                blocks.append(segment.text)
             else:
-                raise ValueError("😅 Translation temporarily unavailable. Please try again.")
+                pieces.append(segment.text)
+        text = "".join(pieces)
+        return TranslationUnit(
+            index=index,
+            key=segment_key(text, TARGET_LANGUAGE, PROMPT_VERSION),
+            original="".join(segment.text for segment in group),
+            pieces=pieces,
+            prose=prose,
+            blocks=blocks
+        )
     
-    def translate_chunk(self, text: str) -> str:
-        """Translate a smaller chunk of text"""
-        return self.translate_to_urdu(text)
+    def _plan(self, content: str) -> tuple[list, list[TranslationUnit]]:
+        """
+        Split content into segments and group them into translation units
+        of up to translation_segment_max_tokens of prose, with the blocks
+        between them as markers. Blocks outside any unit pass through
+        untouched, and cached units are reused. Returns (results, pending)
+        where pending holds the units that still need translating.
+        """
+        segments = split_segments(content, max_tokens=self.segment_max_tokens)
+        groups = group_segments(segments, max_tokens=self.segment_max_tokens)
+        results: list = [None] * len(groups)
+        units = []
+        
+        for i, group in enumerate(groups):
+            if any(segment.translatable for segment in group):
+                units.append(self._unit(i, group))
+            else:
+                results[i] = "".join(segment.text for segment in group)
+        
+        # One lookup for the whole request
+        cached = self.cache.get_many(unit.key for unit in units) if self.cache else {}
+        pending = []
+        for unit in units:
+            restored = _restore_blocks(cached[unit.key], unit.blocks) if unit.key in cached else None
+            if restored is not None:
+                results[unit.index] = _with_spacing(unit.original, restored)
+            else:
+                pending.append(unit)
+        
+        return results, pending
+    
+    def _store(self, key: str, translated: str, written: list) -> str:
+        """
+        Cache one unit as soon as its model call returns, so a sibling
+        that fails later does not throw away translations already paid for.
+        It is kept in memory right away and added to `written`, which the
+        request saves to disk in one transaction when it ends.
+        """
+        translated = translated.strip()
+        if self.cache:
+            self.cache.remember(key, translated)
+            written.append((key, translated))
+        return translated
+    
+    def _assemble(self, results: list, pending: list, translations: list[str]) -> str:
+        for unit, translated in zip(pending, translations):
+            results[unit.index] = translated
+        
+        logger.info(
+            f"Translation assembled from {len(results)} parts, "
+            f"{len(pending)} translated by the model"
+        )
+        return "".join(results)
+    
+    def translate_to_urdu(self, content: str, preserve_code: bool = True) -> str:
+        """Blocking wrapper around translate_to_urdu_async, for scripts"""
+        return asyncio.run(self.translate_to_urdu_async(content, preserve_code))
+    
+    async def translate_to_urdu_async(self, content: str, preserve_code: bool = True) -> str:
+        """
+        Translate content to Urdu while preserving code blocks and technical terms.
+        Code, mermaid and math blocks are replaced by markers and never sent
+        to the model, so the prose around them is translated in one or two
+        calls per chapter; cached units are reused, and the rest run
+        concurrently (at most translation_max_parallel at a time).
+        """
+        
+        if not self.llm.configured:
+            raise ValueError("Gemini API key not configured in .env file")
+        
+        with span("translate", chars=len(content)) as trace_span:
+            # Splitting and the cache lookup (SQLite) stay off the event loop
+            results, pending = await asyncio.to_thread(self._plan, content)
+            if trace_span is not None:
+                trace_span.set(segments=len(results), uncached=len(pending))
+            semaphore = asyncio.Semaphore(self.max_parallel)
+            
+            written = []
+            
+            async def translate(key: str, text: str, blocks: list[str]) -> Optional[str]:
+                async with semaphore:
+                    translated = await self.translate_chunk_async(text)
+                if blocks and _restore_blocks(translated, blocks) is None:
+                    # Not cached: the caller retries the unit piece by piece
+                    return None
+                return self._store(key, translated, written)
+            
+            def translate_once(key: str, text: str, blocks: list[str]):
+                # Keyed like the cache: same text, language and prompt version
+                if self.flights is None:
+                    return translate(key, text, blocks)
+                return self.flights.do(key, lambda: translate(key, text, blocks))
+            
+            async def translate_unit(unit: TranslationUnit) -> str:
+                translated = await translate_once(unit.key, unit.text, unit.blocks)
+                if translated is None:
+                    translated = await translate_pieces(unit)
+                return _with_spacing(unit.original, _restore_blocks(translated, unit.blocks))
+            
+            async def translate_pieces(unit: TranslationUnit) -> str:
+                """Fallback when the model dropped or moved a marker"""
+                logger.warning(
+                    f"Translation: block markers lost in a {len(unit.blocks)}-block unit, "
+                    f"translating its {len(unit.prose)} prose segments separately"
+                )
+                parts = await asyncio.gather(*(
+                    translate_once(segment_key(unit.pieces[i], TARGET_LANGUAGE, PROMPT_VERSION), unit.pieces[i], [])
+                    for i in unit.prose
+                ), return_exceptions=True)
+                errors = [part for part in parts if isinstance(part, BaseException)]
+                if errors:
+                    raise errors[0]
+                pieces = list(unit.pieces)
+                for i, part in zip(unit.prose, parts):
+                    pieces[i] = _with_spacing(pieces[i], part)
+                # Cached with its markers, like a unit translated in one call
+                return self._store(unit.key, "".join(pieces), written)
+            
+            # Every unit runs to completion even if a sibling fails, so a
+            # retry only pays for the units that actually failed
+            try:
+                translations = await asyncio.gather(
+                    *(translate_unit(unit) for unit in pending), return_exceptions=True
+                )
+            finally:
+                if written:
+                    await asyncio.to_thread(self.cache.put_many, written)
+            errors = [result for result in translations if isinstance(result, BaseException)]
+            if errors:
+                logger.warning(
+                    f"Translation: {len(errors)} of {len(pending)} units failed; "
+                    f"the other {len(pending) - len(errors)} are cached"
+                )
+                raise errors[0]
+            return self._assemble(results, pending, translations)
+
+
+def _restore_blocks(translated: str, blocks: list[str]) -> Optional[str]:
+    """
+    Put the original blocks back in place of their markers, or None if the
+    markers did not come back exactly once each and in order
+    """
+    if not blocks:
+        return translated
+    if [int(n) for n in MARKER_PATTERN.findall(translated)] != list(range(len(blocks))):
+        return None
+
+    def block(match: re.Match) -> str:
+        # A block always starts on a line of its own
+        starts_line = match.start() == 0 or translated[match.start() - 1] == "\n"
+        return ("" if starts_line else "\n") + blocks[int(match.group(1))]
+
+    return MARKER_PATTERN.sub(block, translated)
+
+
+def _with_spacing(original: str, translated: str) -> str:
+    """Re-apply the original segment's leading/trailing whitespace"""
+    stripped = original.strip()
+    if not stripped:
+        return original
+    start = original.index(stripped[0])
+    end = len(original.rstrip())
+    return original[:start] + translated + original[end:]
 
 
 # Singleton
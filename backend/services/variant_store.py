@@ -0,0 +1,100 @@
+"""
+Variant Store - precomputed translated/personalized chapter variants.
+Written offline by pregenerate.py and read by the API so most traffic on a
+static textbook is served without a model call. One SQLite file, outputs
+zlib-compressed, looked up by primary key.
+"""
+
+from pathlib import Path
+from typing import Optional
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from config import data_path
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+
+
+class VariantStore:
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS variants ("
+            "kind TEXT NOT NULL, source TEXT NOT NULL, variant TEXT NOT NULL, "
+            "content_hash TEXT NOT NULL, output BLOB NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, source, variant))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS variants_by_hash ON variants (kind, content_hash, variant)"
+        )
+        self._db.commit()
+
+    def get(self, kind: str, variant: str, content: str, source: Optional[str] = None) -> Optional[str]:
+        """
+        The variant generated from exactly `content`. With `source` the row is
+        found by path, but only served if its content hash still matches, so
+        an edited chapter or a partial selection falls through to live
+        generation.
+        """
+        digest = content_hash(content)
+        with self._lock:
+            if source:
+                row = self._db.execute(
+                    "SELECT output, content_hash FROM variants WHERE kind = ? AND source = ? AND variant = ?",
+                    (kind, source, variant)
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT output, content_hash FROM variants WHERE kind = ? AND content_hash = ? AND variant = ?",
+                    (kind, digest, variant)
+                ).fetchone()
+        if row is None or row[1] != digest:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def is_current(self, kind: str, source: str, variant: str, digest: str) -> bool:
+        """True if this variant was generated from content with this hash"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash FROM variants WHERE kind = ? AND source = ? AND variant = ?",
+                (kind, source, variant)
+            ).fetchone()
+        return row is not None and row[0] == digest
+
+    def put(self, kind: str, source: str, variant: str, digest: str, output: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO variants "
+                "(kind, source, variant, content_hash, output, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, source, variant, digest, zlib.compress(output.encode("utf-8"), 9), time.time())
+            )
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM variants").fetchone()[0]
+
+
+# Singleton; only opened when a pregenerated store exists
+_variant_store: Optional[VariantStore] = None
+
+
+def get_variant_store() -> Optional[VariantStore]:
+    global _variant_store
+    if _variant_store is None:
+        path = data_path("variants.sqlite3")
+        if path.exists():
+            _variant_store = VariantStore(path)
+            logger.info(f"Serving {_variant_store.count()} precomputed variants from {path}")
+    return _variant_store
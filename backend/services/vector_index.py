@@ -0,0 +1,92 @@
+"""
+Vector Index - exact nearest-neighbour search over a contiguous matrix.
+Embeddings live in one preallocated float32 array with normalized rows,
+so a query is a single matrix-vector product followed by argpartition.
+"""
+
+import numpy as np
+
+
+class VectorIndex:
+    def __init__(self, dimension: int, initial_capacity: int = 1024):
+        self.dimension = dimension
+        self._matrix = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._rows: dict[int, int] = {}  # chunk id -> row
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def copy(self) -> "VectorIndex":
+        """Independent copy of the used rows, e.g. to snapshot without holding a lock"""
+        index = VectorIndex(self.dimension, initial_capacity=max(1, self._size))
+        index._matrix[:self._size] = self._matrix[:self._size]
+        index._ids[:self._size] = self._ids[:self._size]
+        index._rows = dict(self._rows)
+        index._size = self._size
+        return index
+
+    def _grow(self, needed: int):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dimension), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+    def add(self, ids: list[int], vectors: np.ndarray):
+        """Add rows for `ids`. Vectors must already be L2-normalized."""
+        for doc_id in ids:
+            if doc_id in self._rows:
+                self.remove(doc_id)
+        self._grow(self._size + len(ids))
+        end = self._size + len(ids)
+        self._matrix[self._size:end] = vectors
+        self._ids[self._size:end] = ids
+        for offset, doc_id in enumerate(ids):
+            self._rows[doc_id] = self._size + offset
+        self._size = end
+
+    def remove(self, doc_id: int):
+        """Remove a row by moving the last row into its slot (keeps the matrix dense)"""
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._size = last
+
+    def vector(self, doc_id: int) -> np.ndarray:
+        return self._matrix[self._rows[doc_id]]
+
+    def search(self, query: np.ndarray, limit: int = 3) -> list[tuple[int, float]]:
+        """Top `limit` (id, cosine similarity) pairs, best first"""
+        if self._size == 0 or limit <= 0:
+            return []
+        return top_k(self._matrix[:self._size] @ query, self._ids, limit)
+
+    def search_ids(self, query: np.ndarray, ids, limit: int = 3) -> list[tuple[int, float]]:
+        """Like search, but only scores the rows of the given chunk ids"""
+        rows = np.fromiter((self._rows[i] for i in ids if i in self._rows), dtype=np.int64)
+        if len(rows) == 0 or limit <= 0:
+            return []
+        return top_k(self._matrix[rows] @ query, self._ids[rows], limit)
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, limit: int) -> list[tuple[int, float]]:
+    """(id, score) pairs for the `limit` highest scores, best first"""
+    if limit < len(scores):
+        top = np.argpartition(scores, -limit)[-limit:]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(scores[top])[::-1]]
+    return [(int(ids[i]), float(scores[i])) for i in top]
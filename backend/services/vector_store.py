@@ -0,0 +1,205 @@
+"""
+Vector Store - where RAGService keeps chunk embeddings.
+"memory" keeps them in a local contiguous matrix (see vector_index.py);
+"qdrant" keeps them in a Qdrant collection through one shared client.
+Both take batched upserts and can restrict a search to a chapter or source.
+"""
+
+from typing import Iterable, Optional
+import logging
+import threading
+import warnings
+
+import numpy as np
+
+from config import get_settings
+from services.metadata_index import INDEXED_FIELDS, Scope
+from services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """Interface for chunk embedding storage and top-k search"""
+    name = "base"
+    dimension: int
+
+    def add(self, ids: list[int], vectors: np.ndarray, payloads: list[dict]):
+        raise NotImplementedError
+
+    def remove(self, chunk_id: int):
+        self.remove_many([chunk_id])
+
+    def remove_many(self, ids: Iterable[int]):
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray, limit: int = 3, scope: Optional[Scope] = None) -> list[tuple[int, float]]:
+        """Top-k by cosine similarity, restricted to `scope` when given"""
+        raise NotImplementedError
+
+    def make_mutable(self):
+        """Called before the first write; only matters for mapped snapshots"""
+
+    def clear(self):
+        """Drop every vector, e.g. points left over from an index that no longer exists"""
+        raise NotImplementedError
+
+
+class InMemoryVectorStore(VectorStore):
+    name = "memory"
+
+    def __init__(self, dimension: int, index=None):
+        """`index` may be a mapped snapshot index (see chunk_store.py)"""
+        self.dimension = dimension
+        self.index = index if index is not None else VectorIndex(dimension)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add(self, ids: list[int], vectors: np.ndarray, payloads: list[dict]):
+        self.index.add(ids, vectors)
+
+    def remove_many(self, ids: Iterable[int]):
+        for chunk_id in ids:
+            self.index.remove(chunk_id)
+
+    def vector(self, chunk_id: int) -> np.ndarray:
+        return self.index.vector(chunk_id)
+
+    def search(self, query: np.ndarray, limit: int = 3, scope: Optional[Scope] = None) -> list[tuple[int, float]]:
+        if scope is None:
+            return self.index.search(query, limit)
+        return self.index.search_ids(query, scope.ids, limit)
+
+    def make_mutable(self):
+        if not isinstance(self.index, VectorIndex):
+            self.index = self.index.to_index()
+
+    def clear(self):
+        self.index = VectorIndex(self.dimension)
+
+
+# One client per process; the HTTP client inside keeps a connection pool
+_qdrant_client = None
+_qdrant_lock = threading.Lock()
+
+
+def get_qdrant_client():
+    global _qdrant_client
+    with _qdrant_lock:
+        if _qdrant_client is None:
+            from qdrant_client import QdrantClient
+            settings = get_settings()
+            if settings.qdrant_url == ":memory:":
+                _qdrant_client = QdrantClient(location=":memory:")
+            elif settings.qdrant_url.startswith(("http://", "https://")):
+                _qdrant_client = QdrantClient(
+                    url=settings.qdrant_url,
+                    api_key=settings.qdrant_api_key or None,
+                    timeout=settings.qdrant_timeout_seconds
+                )
+            else:
+                # Local on-disk mode, e.g. QDRANT_URL=data/qdrant
+                _qdrant_client = QdrantClient(path=settings.qdrant_url)
+            logger.info(f"Qdrant client created for {settings.qdrant_url}")
+        return _qdrant_client
+
+
+class QdrantVectorStore(VectorStore):
+    name = "qdrant"
+
+    def __init__(self, dimension: int, collection: str, batch_size: int = 128, client=None):
+        from qdrant_client import models
+        self.models = models
+        self.dimension = dimension
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.client = client or get_qdrant_client()
+        self._ensure_collection()
+
+    def _ensure_collection(self):
+        existing = {c.name for c in self.client.get_collections().collections}
+        if self.collection in existing:
+            return
+        self.client.create_collection(
+            collection_name=self.collection,
+            vectors_config=self.models.VectorParams(
+                size=self.dimension, distance=self.models.Distance.COSINE
+            )
+        )
+        with warnings.catch_warnings():
+            # Local (in-process) Qdrant warns that it ignores payload indexes
+            warnings.simplefilter("ignore", UserWarning)
+            for field in INDEXED_FIELDS:
+                self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field,
+                    field_schema=self.models.PayloadSchemaType.KEYWORD
+                )
+        logger.info(f"Created Qdrant collection {self.collection} ({self.dimension} dims)")
+
+    def __len__(self) -> int:
+        return self.client.count(collection_name=self.collection, exact=True).count
+
+    def clear(self):
+        self.client.delete_collection(collection_name=self.collection)
+        self._ensure_collection()
+
+    def add(self, ids: list[int], vectors: np.ndarray, payloads: list[dict]):
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            points = [
+                self.models.PointStruct(id=chunk_id, vector=vector.tolist(), payload=payload)
+                for chunk_id, vector, payload in zip(ids[start:end], vectors[start:end], payloads[start:end])
+            ]
+            self.client.upsert(collection_name=self.collection, points=points, wait=True)
+
+    def remove_many(self, ids: Iterable[int]):
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            self.client.delete(
+                collection_name=self.collection,
+                points_selector=self.models.PointIdsList(points=ids[start:start + self.batch_size])
+            )
+
+    def search(self, query: np.ndarray, limit: int = 3, scope: Optional[Scope] = None) -> list[tuple[int, float]]:
+        query_filter = None
+        if scope is not None:
+            # Qdrant filters on its own payload index rather than a list of ids
+            query_filter = self.models.Filter(must=[
+                self.models.FieldCondition(key=field, match=self.models.MatchValue(value=value))
+                for field, value in scope.filters.items()
+            ])
+        if hasattr(self.client, "query_points"):
+            points = self.client.query_points(
+                collection_name=self.collection,
+                query=query.tolist(),
+                limit=limit,
+                query_filter=query_filter
+            ).points
+        else:
+            # qdrant-client < 1.10
+            points = self.client.search(
+                collection_name=self.collection,
+                query_vector=query.tolist(),
+                limit=limit,
+                query_filter=query_filter
+            )
+        return [(int(point.id), float(point.score)) for point in points]
+
+
+def create_vector_store(dimension: int, backend: Optional[str] = None) -> VectorStore:
+    """Build the store named by Settings.vector_store"""
+    settings = get_settings()
+    backend = backend or settings.vector_store
+    if backend == "qdrant":
+        if not settings.qdrant_url:
+            raise ValueError("vector_store=qdrant requires QDRANT_URL (a URL, a local path or :memory:)")
+        return QdrantVectorStore(
+            dimension,
+            settings.qdrant_collection_name,
+            batch_size=settings.qdrant_upsert_batch_size
+        )
+    if backend == "memory":
+        return InMemoryVectorStore(dimension)
+    raise ValueError(f"Unknown vector store: {backend}")
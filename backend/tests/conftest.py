@@ -0,0 +1,10 @@
+"""
+Shared test setup. The backend's modules import each other as top-level
+packages (services, config), so backend/ goes on sys.path however pytest
+is started.
+"""
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,64 @@
+"""
+split_segments must give back the input byte for byte, and only lift out
+blocks that are actually closed.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from services.markdown_segments import CODE, MATH, PASSTHROUGH, group_segments, split_segments
+
+DOCS_PATH = Path(__file__).parent.parent.parent / "docs"
+CHAPTERS = sorted(DOCS_PATH.rglob("*.md"))
+
+
+def joined(segments) -> str:
+    return "".join(segment.text for segment in segments)
+
+
+@pytest.mark.parametrize("path", CHAPTERS, ids=lambda path: path.relative_to(DOCS_PATH).as_posix())
+@pytest.mark.parametrize("max_tokens", [50, 800])
+def test_chapters_round_trip(path, max_tokens):
+    content = path.read_text(encoding="utf-8")
+    segments = split_segments(content, max_tokens=max_tokens)
+    assert joined(segments) == content
+    groups = group_segments(segments, max_tokens=max_tokens)
+    assert [segment for group in groups for segment in group] == segments
+
+
+def test_blocks_are_lifted_out():
+    content = (
+        "---\ntitle: Test\n---\n\n"
+        "Some prose.\n\n"
+        "```python\nprint('hi')\n```\n\n"
+        "$$\nx = 1\n$$\n\n"
+        "More prose.\n"
+    )
+    segments = split_segments(content)
+    assert joined(segments) == content
+    assert segments[0].kind == PASSTHROUGH and segments[0].text == "---\ntitle: Test\n---\n"
+    blocks = {segment.kind: segment.text for segment in segments if segment.kind in (CODE, MATH)}
+    assert blocks == {CODE: "```python\nprint('hi')\n```\n", MATH: "$$\nx = 1\n$$\n"}
+
+
+def test_unclosed_display_math_is_prose():
+    content = "Intro.\n\n$$ x = 1\n\n## Next\n\nMore text to translate.\n"
+    segments = split_segments(content)
+    assert joined(segments) == content
+    assert all(segment.kind != MATH for segment in segments)
+    assert "More text to translate." in "".join(s.text for s in segments if s.translatable)
+
+
+def test_unclosed_math_does_not_hide_later_blocks():
+    content = "$$ start\n\nText.\n\n```bash\nls\n```\n"
+    segments = split_segments(content)
+    assert joined(segments) == content
+    assert [segment.text for segment in segments if segment.kind == CODE] == ["```bash\nls\n```\n"]
+
+
+def test_groups_bridge_blocks_between_prose():
+    content = "First.\n\n```\ncode\n```\n\nSecond.\n"
+    groups = group_segments(split_segments(content), max_tokens=800)
+    assert len(groups) == 1
+    assert joined(groups[0]) == content
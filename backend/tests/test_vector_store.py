@@ -0,0 +1,95 @@
+"""
+The in-memory store and Qdrant (local :memory: mode) must return the same
+neighbours for the same data, with and without a metadata scope.
+"""
+
+import numpy as np
+import pytest
+
+from services.metadata_index import MetadataIndex
+from services.vector_store import InMemoryVectorStore, QdrantVectorStore
+
+DIMENSION = 16
+COUNT = 60
+
+
+def normalized(matrix: np.ndarray) -> np.ndarray:
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    ids = list(range(COUNT))
+    vectors = normalized(rng.normal(size=(COUNT, DIMENSION)))
+    payloads = [
+        {"chapter": f"chapter-{i % 3}", "source": f"chapter-{i % 3}/page-{i % 6}.md"}
+        for i in ids
+    ]
+    queries = normalized(rng.normal(size=(5, DIMENSION)))
+    return ids, vectors, payloads, queries
+
+
+@pytest.fixture
+def qdrant():
+    qdrant_client = pytest.importorskip("qdrant_client")
+    client = qdrant_client.QdrantClient(":memory:")
+    store = QdrantVectorStore(DIMENSION, "test_chunks", batch_size=16, client=client)
+    yield store
+    client.close()
+
+
+@pytest.fixture
+def stores(data, qdrant):
+    ids, vectors, payloads, _ = data
+    memory = InMemoryVectorStore(DIMENSION)
+    for store in (memory, qdrant):
+        store.add(ids, vectors, payloads)
+    return memory, qdrant
+
+
+def metadata_for(data) -> MetadataIndex:
+    ids, _, payloads, _ = data
+    metadata = MetadataIndex()
+    for chunk_id, payload in zip(ids, payloads):
+        metadata.add(chunk_id, payload)
+    return metadata
+
+
+def assert_same_results(memory, qdrant, query, limit, scope=None):
+    expected = memory.search(query, limit, scope)
+    actual = qdrant.search(query, limit, scope)
+    assert [chunk_id for chunk_id, _ in actual] == [chunk_id for chunk_id, _ in expected]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected], abs=1e-4)
+
+
+def test_search_parity(data, stores):
+    memory, qdrant = stores
+    assert len(memory) == len(qdrant) == COUNT
+    for query in data[3]:
+        assert_same_results(memory, qdrant, query, limit=5)
+
+
+@pytest.mark.parametrize("filters", [{"chapter": "chapter-1"}, {"source": "chapter-2/page-5.md"}])
+def test_scoped_search_parity(data, stores, filters):
+    memory, qdrant = stores
+    scope = metadata_for(data).scope(**filters)
+    for query in data[3]:
+        assert_same_results(memory, qdrant, query, limit=4, scope=scope)
+        results = memory.search(query, 4, scope)
+        assert {chunk_id for chunk_id, _ in results} <= set(scope.ids.tolist())
+
+
+def test_remove_and_clear_parity(data, stores):
+    memory, qdrant = stores
+    removed = [chunk_id for chunk_id, _ in memory.search(data[3][0], 3)]
+    for store in (memory, qdrant):
+        store.remove_many(removed)
+    assert len(memory) == len(qdrant) == COUNT - len(removed)
+    assert_same_results(memory, qdrant, data[3][0], limit=5)
+    assert not set(removed) & {chunk_id for chunk_id, _ in qdrant.search(data[3][0], 5)}
+
+    for store in (memory, qdrant):
+        store.clear()
+    assert len(memory) == len(qdrant) == 0
+    assert memory.search(data[3][0], 5) == qdrant.search(data[3][0], 5) == []
@@ -20,6 +20,10 @@ const config = {
   onBrokenLinks: 'throw',
   onBrokenMarkdownLinks: 'warn',
 
+  // I also serve the chapter Markdown as-is, so the Personalize/Translate
+  // buttons can send the exact source the backend pregenerated variants from
+  staticDirectories: ['static', 'docs'],
+
   i18n: {
     defaultLocale: 'en',
     locales: ['en'],
@@ -1,4 +1,6 @@
 import React, { useState, useEffect } from 'react';
+import { useDoc } from '@docusaurus/plugin-content-docs/client';
+import useBaseUrl from '@docusaurus/useBaseUrl';
 import styles from './ChapterActions.module.css';
 import { getApiUrl, isBackendAvailable } from '../../config/api';
 
@@ -7,7 +9,8 @@ import { getApiUrl, isBackendAvailable } from '../../config/api';
   
   For GitHub Pages (static hosting), it uses DEMO MODE with simulated
   responses since there's no backend. For local development with
-  the FastAPI backend running, it uses the real API.
+  the FastAPI backend running, it uses the real API, sending the
+  chapter's Markdown and its docs path so precomputed variants match.
 */
 
 interface UserProfile {
@@ -33,6 +36,11 @@ export default function ChapterActions({ className }: ChapterActionsProps): Reac
     const [error, setError] = useState<string | null>(null);
     const [user, setUser] = useState<UserProfile | null>(null);
 
+    // Docs-relative path, e.g. "chapter-02-foundations/ros2-intro.md"
+    const { metadata } = useDoc();
+    const source = metadata.source.replace(/^@site\/docs\//, '');
+    const markdownUrl = useBaseUrl(`/${source}`);
+
     // Load user profile on mount
     useEffect(() => {
         const stored = localStorage.getItem('ai_textbook_user');
@@ -52,6 +60,19 @@ export default function ChapterActions({ className }: ChapterActionsProps): Reac
             document.querySelector('main');
     };
 
+    // The chapter's Markdown, or the rendered text if it can't be fetched
+    const getChapterMarkdown = async (contentEl: Element): Promise<string> => {
+        try {
+            const response = await fetch(markdownUrl);
+            if (response.ok) {
+                return await response.text();
+            }
+        } catch (err) {
+            console.log('Chapter Markdown unavailable, sending page text');
+        }
+        return contentEl.textContent || '';
+    };
+
     // Demo personalization (for GitHub Pages without backend)
     const getDemoPersonalizedContent = (original: string): string => {
         const level = user?.experienceLevel || 'beginner';
@@ -106,12 +127,13 @@ export default function ChapterActions({ className }: ChapterActionsProps): Reac
                 if (isBackendAvailable()) {
                     // Try real backend
                     try {
-                        const contentText = contentEl.textContent?.slice(0, 2000) || '';
+                        const content = await getChapterMarkdown(contentEl);
                         const response = await fetch(`${API_URL}/api/personalize`, {
                             method: 'POST',
                             headers: { 'Content-Type': 'application/json' },
                             body: JSON.stringify({
-                                content: contentText,
+                                content,
+                                source,
                                 experience_level: user?.experienceLevel || 'beginner',
                                 background: user?.softwareBackground || 'other',
                                 interests: user?.interests || ['robotics', 'ai'],
@@ -207,12 +229,13 @@ export default function ChapterActions({ className }: ChapterActionsProps): Reac
                 if (isBackendAvailable()) {
                     // Try real backend
                     try {
-                        const contentText = contentEl.textContent?.slice(0, 1500) || '';
+                        const content = await getChapterMarkdown(contentEl);
                         const response = await fetch(`${API_URL}/api/translate`, {
                             method: 'POST',
                             headers: { 'Content-Type': 'application/json' },
                             body: JSON.stringify({
-                                content: contentText,
+                                content,
+                                source,
                                 target_language: 'urdu'
                             })
                         });